@@ -4,6 +4,7 @@
 from __future__ import division
 import numpy as np
 import h5py
+from time_axis import TimeAxis
 
 class _load_adcp:
     """
@@ -70,6 +71,9 @@ class _load_adcp:
             except KeyError:
                 pass
 
+        #Time index, see time_axis
+        self._time = TimeAxis(self.matlabTime)
+
         #Find the depth average of a variable based on percent_of_depth
         #choosen by the user. Currently only working for east_vel (u) and
         #north_vel (v)
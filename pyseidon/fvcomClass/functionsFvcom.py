@@ -10,6 +10,15 @@ from datetime import datetime
 from datetime import timedelta
 from interpolation_utils import *
 from miscellaneous import *
+from time_axis import time_axis
+from spatial_index import locate
+from probe import Probe
+from mesh_operators import gradient_operators, apply_operator
+from mesh_operators import node_to_element
+from mesh_operators import operator_over_time
+from memory_utils import evaluate, allocate
+from turbine import power_series, power_sweep
+from exceedance import exceedance_curves
 from BP_tools import *
 from utide import ut_solv, ut_reconstr
 import time
@@ -27,11 +36,36 @@ class FunctionsFvcom:
         self._grid = grid
         self._plot = plot
         self._History = History
+        #Storage type and memory budget of the derived fields,
+        #see FVCOM dtype and max_memory options
+        self._dtype = getattr(variable, '_dtype', None)
+        self._max_memory = getattr(variable, '_max_memory', None)
         #Create pointer to FVCOM class
         variable = self._var
         grid = self._grid
         History = self._History
 
+    def _evaluate(self, ex, local_dict):
+        """numexpr evaluation in the storage type and memory budget"""
+        return evaluate(ex, local_dict, dtype=self._dtype,
+                        max_memory=self._max_memory)
+
+    def _allocate(self, shape):
+        """Array for a derived field, in the storage type and memory budget"""
+        dtype = self._dtype
+        if dtype is None:
+            dtype = float
+        return allocate(shape, dtype=dtype, max_memory=self._max_memory)
+
+    def _operator(self, terms, ntime, time=None):
+        """Sum of sparse mesh operators applied to variables, see
+           mesh_operators.operator_over_time"""
+        dtype = self._dtype
+        if dtype is None:
+            dtype = float
+        return operator_over_time(terms, ntime, time=time, dtype=dtype,
+                                  max_memory=self._max_memory)
+
     #TR comment: I don't think I need this anymore  
     def _centers(self, var, debug=False):
         """
@@ -46,15 +80,10 @@ class FunctionsFvcom:
         if debug:
             print 'Computing central bathy...'
 
-        #Interpolation at centers
-        size = self._grid.nele
-        size1 = self._grid.ntime
-        elc = np.zeros((size1, size))
-        hc = np.zeros((size))
-        #TR comment: I am dubeous about the interpolation method here
-        for ind, value in enumerate(self._grid.trinodes):
-            elc[:, ind] = np.mean(self._var.el[:, value-1], axis=1)
-            hc[ind] = np.mean(self._grid.h[value-1])
+        #Interpolation at centers, i.e. mean of the 3 nodes
+        n2e = node_to_element(self._grid)
+        elc = self._operator([(n2e, self._var.el)], self._grid.ntime)
+        hc = apply_operator(n2e, self._grid.h[:])
 
         #Custom return    
         self._grid.hc = hc
@@ -84,7 +113,7 @@ class FunctionsFvcom:
         try:
             u = self._var.ua
             v = self._var.va
-            vel = ne.evaluate('sqrt(u**2 + v**2)')  
+            vel = self._evaluate('sqrt(u**2 + v**2)', {'u': u, 'v': v})
         except MemoryError:
             print '---Data too large for machine memory---'
             print 'Tip: use ax or tx during class initialisation'
@@ -118,7 +147,8 @@ class FunctionsFvcom:
         try:
             u = self._var.ua
             v = self._var.va
-            dirFlow = np.rad2deg(np.arctan2(v,u))
+            dirFlow = self._evaluate('arctan2(v, u)', {'u': u, 'v': v})
+            np.rad2deg(dirFlow, out=dirFlow)
 
         except MemoryError:
             print '---Data too large for machine memory---'
@@ -176,19 +206,17 @@ class FunctionsFvcom:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
 
         #Choose the right pair of velocity components
         u = self._var.ua
         v = self._var.va
 
         #Extraction at point
-        # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        # Finding containing element
+        index = locate(self._grid, pt_lon, pt_lat)[0]
         if debug:
             print 'Extraction of u and v at point...'
         U = self.interpolation_at_point(u, pt_lon, pt_lat, index=index,
@@ -270,21 +298,17 @@ class FunctionsFvcom:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end,
-                                        self._var.matlabTime,
-                                        debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
 
         #Choose the right pair of velocity components
         u = self._var.ua
         v = self._var.va
 
         #Extraction at point
-        # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        # Finding containing element
+        index = locate(self._grid, pt_lon, pt_lat)[0]
         if debug:
             print 'Extraction of u and v at point...'
         U = self.interpolation_at_point(u, pt_lon, pt_lat, index=index,
@@ -369,18 +393,16 @@ class FunctionsFvcom:
 
         Keywords:
         --------
-          - index = element index, integer. Use only if closest element index
+          - index = element index, integer. Use only if containing element index
                     is already known
 
         Notes:
         -----
-          - use index if closest element already known
+          - use index if containing element already known
         """
         debug = (debug or self._debug)
         if debug:
             print 'Interpolaling at point...'
-        lonc = self._grid.lonc[:]
-        latc = self._grid.latc[:]
         xc = self._grid.xc[:]
         yc = self._grid.yc[:]
         lon = self._grid.lon[:]
@@ -388,8 +410,8 @@ class FunctionsFvcom:
         trinodes = self._grid.trinodes[:]
 
         if index==[]:
-            # Find indices of the closest element
-            index = closest_point([pt_lon], [pt_lat], lonc, latc, debug=debug)[0]
+            # Find index of the containing element
+            index = locate(self._grid, pt_lon, pt_lat)[0]
         # Conversion (lon, lat) to (x, y)
         pt_x = interp_at_point(self._grid.x, pt_lon, pt_lat, lon, lat,
                                index=index, trinodes=trinodes, debug=debug)
@@ -418,6 +440,78 @@ class FunctionsFvcom:
 
         return varInterp
 
+    def interpolation_at_points(self, var, pt_lons, pt_lats, index=[],
+                                debug=False):
+        """
+        This function interpolates any given variables at many locations
+        at once.
+
+        Inputs:
+        ------
+          - var = any FVCOM grid data or variable, numpy array,
+                  dim=(nele or node), (time, nele or node)
+                  or (time, level, nele or node)
+          - pt_lons = longitudes in decimal degrees East to find,
+                      list of float numbers
+          - pt_lats = latitudes in decimal degrees North to find,
+                      list of float numbers
+
+        Outputs:
+        -------
+           - varInterp = var interpolated at the points, numpy array,
+                         dim=(point), (time, point) or (time, level, point)
+
+        Keywords:
+        --------
+          - index = element indices, list of integers. Use only if
+                    containing element indices are already known
+
+        Notes:
+        -----
+          - the columns of var needed by all the points are read at once,
+            ex: virtual moorings along a transect in one call
+          - use probe to interpolate several variables at the same points
+          - nan at the points outside the mesh
+        """
+        debug = (debug or self._debug)
+        if debug:
+            print 'Interpolaling at points...'
+        probe = Probe(self._grid, pt_lons, pt_lats, index=index)
+
+        return probe.apply(var, debug=debug)
+
+    def probe(self, pt_lons, pt_lats, index=[], debug=False):
+        """
+        This function sets virtual probes at given locations, i.e. the
+        interpolation weights are computed once and then applied to any
+        variable.
+
+        Inputs:
+        ------
+          - pt_lons = longitudes in decimal degrees East, list of floats
+          - pt_lats = latitudes in decimal degrees North, list of floats
+
+        Outputs:
+        -------
+          - probe = Probe, see probe.Probe
+
+        Keywords:
+        --------
+          - index = element indices, list of integers. Use only if
+                    containing element indices are already known
+
+        Notes:
+        -----
+          - ex: probe = fvcom.Util2D.probe(lons, lats)
+                el = probe.apply(fvcom.Variables.el)
+                ua = probe.apply(fvcom.Variables.ua)
+        """
+        debug = (debug or self._debug)
+        if debug:
+            print 'Setting probes...'
+
+        return Probe(self._grid, pt_lons, pt_lats, index=index)
+
     def exceedance(self, var, pt_lon=[], pt_lat=[], debug=False):
         """
         This function calculates the excedence curve of a var(time)
@@ -441,6 +535,8 @@ class FunctionsFvcom:
         Notes:
         -----
           - This method is not suitable for SSE
+          - Exceedance is the % of time steps above each bin, see
+            exceedance.exceedance_curves
         """
         debug = (debug or self._debug)
         if debug:
@@ -458,21 +554,7 @@ class FunctionsFvcom:
         Max = max(signal)	
         dy = (Max/30.0)
         Ranges = np.arange(0,(Max + dy), dy)
-        Exceedance = np.zeros(Ranges.shape[0])
-        dt = self._var.julianTime[1] - self._var.julianTime[0]
-        Period = var.shape[0] * dt
-        time = np.arange(0.0, Period, dt)
-
-        N = len(signal)
-        M = len(Ranges)
-
-        for i in range(M):
-            r = Ranges[i]
-            for j in range(N-1):
-                if signal[j] > r:
-                    Exceedance[i] = Exceedance[i] + (time[j+1] - time[j])
-
-        Exceedance = (Exceedance * 100) / Period
+        Exceedance, Ranges = exceedance_curves(signal, bins=Ranges)
 
         if debug:
             print '...Passed'
@@ -483,6 +565,50 @@ class FunctionsFvcom:
 
         return Exceedance, Ranges
 
+    def exceedance_map(self, var, bins=31, index=[], debug=False):
+        """
+        This function calculates the excedence curves of a var(time)
+        at every element or node, or a subset of them.
+
+        Inputs:
+        ------
+          - var = given quantity, 2 or 3D array,
+                  i.e (time, nele or node) or (time, level, nele or node)
+
+        Keywords:
+        --------
+          - bins = number of amplitude bins from 0 to the maximum of var,
+                   integer, or amplitude bins, increasing 1D array
+          - index = element or node indices to work on, list of integers.
+                    All by default
+
+        Outputs:
+        -------
+          - Exceedance = % of time steps above each bin, 2D array
+                         (nbins, nele or node or len(index)), or 3D array
+                         (nbins, level, nele or node or len(index))
+          - Ranges = signal amplitude bins, 1D array (nbins)
+
+        Notes:
+        -----
+          - ex: exceedance of 1 m/s over the domain
+                  E, R = fvcom.Util2D.exceedance_map(
+                         fvcom.Variables.hori_velo_norm, bins=[0.5, 1.0, 1.5])
+                  E[1,:]
+          - computed by chunks of time steps within the memory budget
+        """
+        debug = (debug or self._debug)
+        if debug:
+            print 'Computing exceedance map...'
+
+        Exceedance, Ranges = exceedance_curves(var, bins=bins, index=index,
+                                               max_memory=self._max_memory)
+
+        if debug:
+            print '...Passed'
+
+        return Exceedance, Ranges
+
     def vorticity(self, debug=False):
         """
         This method creates a new variable: 'depth averaged vorticity (1/s)'
@@ -490,52 +616,17 @@ class FunctionsFvcom:
      
         Notes:
         -----
-          - Can take time over the full domain
+          - the d/dx and d/dy operators of the grid are applied to all the
+            time steps at once, by chunks within max_memory
         """
         debug = (debug or self._debug)
         if debug:
             print 'Computing vorticity...'
             start = time.time()
 
-        t = arange(self._grid.ntime)  
-
-        #Surrounding elements
-        n1 = self._grid.triele[:,0]
-        n2 = self._grid.triele[:,1]
-        n3 = self._grid.triele[:,2]
-        #TR comment: not quiet sure what this step does
-        n1[np.where(n1==0)[0]] = self._grid.trinodes.shape[1]
-        n2[np.where(n2==0)[0]] = self._grid.trinodes.shape[1]
-        n3[np.where(n3==0)[0]] = self._grid.trinodes.shape[1]
-        #TR quick fix: due to error with pydap.proxy.ArrayProxy
-        #              not able to cop with numpy.int
-        n1 = int(n1)
-        n2 = int(n2)
-        n3 = int(n3)
-
-        if debug:
-            end = time.time()
-            print "Check element=0, computation time in (s): ", (end - start)
-            print "start np.multiply" 
-        
-        dvdx = np.zeros((self._grid.ntime,self._grid.nele))
-        dudy = np.zeros((self._grid.ntime,self._grid.nele))
-
-        j=0
-        for i in t:
-            dvdx[j,:] = np.multiply(self._grid.a1u[0,:], self._var.va[i,:]) \
-                      + np.multiply(self._grid.a1u[1,:], self._var.va[i,n1]) \
-                      + np.multiply(self._grid.a1u[2,:], self._var.va[i,n2]) \
-                      + np.multiply(self._grid.a1u[3,:], self._var.va[i,n3])
-            dudy[j,:] = np.multiply(self._grid.a2u[0,:], self._var.ua[i,:]) \
-                      + np.multiply(self._grid.a2u[1,:], self._var.ua[i,n1]) \
-                      + np.multiply(self._grid.a2u[2,:], self._var.ua[i,n2]) \
-                      + np.multiply(self._grid.a2u[3,:], self._var.ua[i,n3])
-            j+=1
-        if debug:
-            print "loop number ", i
-
-        vort = dvdx - dudy
+        ddx, ddy = gradient_operators(self._grid)
+        vort = self._operator([(ddx, self._var.va), (-ddy, self._var.ua)],
+                              self._grid.ntime)
 
         # Add metadata entry
         self._var.depth_av_vorticity = vort
@@ -576,52 +667,19 @@ class FunctionsFvcom:
             t = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                t = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                t = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                t = arange(t_start, t_end)
+                t = np.arange(t_start, t_end)
         else:
-            t = arange(self._grid.ntime)
+            t = np.arange(self._grid.ntime)
             self.vorticity() 
 
         #Checking if vorticity already computed
         if not hasattr(self._var, 'depth_av_vorticity'): 
-            #Surrounding elements
-            n1 = self._grid.triele[:,0]
-            n2 = self._grid.triele[:,1]
-            n3 = self._grid.triele[:,2]
-            #TR comment: not quiet sure what this step does
-            n1[np.where(n1==0)[0]] = self._grid.trinodes.shape[1]
-            n2[np.where(n2==0)[0]] = self._grid.trinodes.shape[1]
-            n3[np.where(n3==0)[0]] = self._grid.trinodes.shape[1]
-            #TR quick fix: due to error with pydap.proxy.ArrayProxy
-            #              not able to cop with numpy.int
-            n1 = int(n1)
-            n2 = int(n2)
-            n3 = int(n3)
-
-            if debug:
-                end = time.time()
-                print "Check element=0, computation time in (s): ", (end - start)
-                print "start np.multiply" 
-        
-            dvdx = np.zeros((t.shape[0],self._grid.nele))
-            dudy = np.zeros((t.shape[0],self._grid.nele))
-
-            j=0
-            for i in t:
-                dvdx[j,:] = np.multiply(self._grid.a1u[0,:], self._var.va[i,:]) \
-                          + np.multiply(self._grid.a1u[1,:], self._var.va[i,n1]) \
-                          + np.multiply(self._grid.a1u[2,:], self._var.va[i,n2]) \
-                          + np.multiply(self._grid.a1u[3,:], self._var.va[i,n3])
-                dudy[j,:] = np.multiply(self._grid.a2u[0,:], self._var.ua[i,:]) \
-                          + np.multiply(self._grid.a2u[1,:], self._var.ua[i,n1]) \
-                          + np.multiply(self._grid.a2u[2,:], self._var.ua[i,n2]) \
-                          + np.multiply(self._grid.a2u[3,:], self._var.ua[i,n3])
-                j+=1
-            if debug:
-                print "loop number ", i
-
-            vort = dvdx - dudy
+            t = np.asarray(t)
+            ddx, ddy = gradient_operators(self._grid)
+            vort = self._operator([(ddx, self._var.va), (-ddy, self._var.ua)],
+                                  t.shape[0], time=t)
         else:
             vort = self._var.depth_av_vorticity[t[:], :]
 
@@ -630,6 +688,38 @@ class FunctionsFvcom:
             print "Computation time in (s): ", (end - start) 
         return vort
 
+    def gradient(self, var, debug=False):
+        """
+        This function computes the horizontal gradient of any element
+        variable.
+
+        Inputs:
+        ------
+          - var = element variable, numpy array, dim=(nele), (time, nele)
+                  or (time, level, nele)
+
+        Outputs:
+        -------
+          - dvardx, dvardy = derivatives along x and y (unit/m), numpy
+                             arrays of the same dimensions as var
+
+        Notes:
+        -----
+          - ex: divergence, dudx + dvdy, from
+                dudx, dudy = fvcom.Util2D.gradient(fvcom.Variables.ua)
+                dvdx, dvdy = fvcom.Util2D.gradient(fvcom.Variables.va)
+        """
+        debug = (debug or self._debug)
+        if debug:
+            print 'Computing gradient...'
+        ddx, ddy = gradient_operators(self._grid)
+        if len(var.shape)==1:
+            return apply_operator(ddx, var), apply_operator(ddy, var)
+        dvardx = self._operator([(ddx, var)], var.shape[0])
+        dvardy = self._operator([(ddy, var)], var.shape[0])
+
+        return dvardx, dvardy
+
     def depth(self, debug=False):
         """
         This method creates a new grid variable: 'depth2D' (m)
@@ -645,19 +735,13 @@ class FunctionsFvcom:
             start = time.time()
 
         print "Computing depth..."
-        #Compute depth      
-        size = self._grid.nele
-        size1 = self._grid.ntime
-        size2 = self._grid.nlevel
-        elc = np.zeros((size1, size))
-        hc = np.zeros((size))
+        #Compute depth at centers, i.e. mean of the 3 nodes
+        n2e = node_to_element(self._grid)
 
         try:
-            for ind, value in enumerate(self._grid.trinodes):
-                elc[:, ind] = np.mean(self._var.el[:, value], axis=1)
-                hc[ind] = np.mean(self._grid.h[value])
-
-            dep = self._var.el[:,:] + h[None,:]
+            hc = apply_operator(n2e, self._grid.h[:])
+            dep = self._operator([(n2e, self._var.el)], self._grid.ntime)
+            dep += hc[None,:]
         except MemoryError:
             print '---Data too large for machine memory---'
             print 'Tip: use ax or tx during class initialisation'
@@ -703,9 +787,7 @@ class FunctionsFvcom:
 
         #Finding index
         if index==[]:      
-            index = closest_point([pt_lon], [pt_lat],
-                                  self._grid.lonc,
-                                  self._grid.latc, debug=debug)[0]
+            index = locate(self._grid, pt_lon, pt_lat)[0]
 
         if not hasattr(self._grid, 'depth2D'):
             #Compute depth
@@ -724,7 +806,7 @@ class FunctionsFvcom:
 
         return dep
 
-    def depth_averaged_power_assessment(self, debug=False):
+    def depth_averaged_power_density(self, debug=False):
         """
         This method creates a new variable: 'depth averaged power density' (W/m2)
         -> FVCOM.Variables.depth_av_power_density
@@ -748,7 +830,7 @@ class FunctionsFvcom:
         if debug: print "Computing powers of hori velo norm..."
         u = self._var.hori_velo_norm
         if debug: print "Computing pd..."
-        pd = ne.evaluate('0.5*1025.0*(u**3)')
+        pd = self._evaluate('0.5*1025.0*(u**3)', {'u': u})
 
         # Add metadata entry
         self._var.depth_av_power_density = pd
@@ -792,55 +874,69 @@ class FunctionsFvcom:
 
         Notes:
         -----
-          - This may take some time to compute depending on the size
-            of the data set
+          - pd is set to 0 below the cut-in power and to the cut-out power
+            above, see turbine.power_series
+          - computed by chunks of time steps within the memory budget
         """
         debug = (debug or self._debug)
-        if debug: print "Computing depth averaged power density..."
+        if debug: print "Computing depth averaged power assessment..."
 
         if not hasattr(self._var, 'hori_velo_norm'):
             if debug: print "Computing hori velo norm..."
             self.hori_velo_norm(debug=debug)
-        if debug: print "Computing powers of hori velo norm..."
         u = self._var.hori_velo_norm
-        if debug: print "Computing pc and dcpc..."
-        pc = ne.evaluate('a4*(u**4) + a3*(u**3) + a2*(u**2) + a1*u + a0')
-        dcpc = ne.evaluate('b2*(tsr**2) + b1*tsr + b0')
-        if debug: print "Computing pd..."
-        pd = ne.evaluate('pc*dcpc*0.5*1025.0*(u**3)')
-
-        if debug: print "finding cut-in and out..."
-        u = cut_in
-        pcin = ne.evaluate('a4*(u**4) + a3*(u**3) + a2*(u**2) + a1*u + a0')
-        dcpcin = ne.evaluate('b2*(tsr**2) + b1*tsr + b0')
-        pdin = ne.evaluate('pcin*dcpcin*0.5*1025.0*(u**3)')
-        #TR comment huge bottleneck here
-        #ind = np.where(pd<pdin)[0]
-        #if not ind.shape[0]==0:
-        #    pd[ind] = 0.0
-        for i in range(pd.shape[0]):
-            for j in range(pd.shape[1]):
-                if pd[i,j] < pdin:
-                   pd[i,j] = 0.0 
-
-        u = cut_out
-        pcout = ne.evaluate('a4*(u**4) + a3*(u**3) + a2*(u**2) + a1*u + a0')
-        dcpcout = ne.evaluate('b2*(tsr**2) + b1*tsr + b0')
-        pdout = ne.evaluate('pcout*dcpcout*0.5*1025.0*(u**3)')
-        #TR comment huge bottleneck here
-        #ind = np.where(pd>pdout)[0]
-        #if not ind.shape[0]==0:
-        #    pd[ind] = pdout
-        for i in range(pd.shape[0]):
-            for j in range(pd.shape[1]):
-                if pd[i,j] > pdout:
-                   pd[i,j] = pdout     
+        parameters = {'cut_in': cut_in, 'cut_out': cut_out, 'tsr': tsr,
+                      'a4': a4, 'a3': a3, 'a2': a2, 'a1': a1, 'a0': a0,
+                      'b2': b2, 'b1': b1, 'b0': b0}
+        dtype = self._dtype
+        if dtype is None:
+            dtype = float
+        if debug: print "Computing pd with cut-in and out..."
+        pd = power_series([u], parameters, dtype=dtype,
+                          max_memory=self._max_memory)
 
         # Add metadata entry
         self._var.depth_av_power_assessment = pd
         self._History.append('depth averaged power assessment computed')
         print '-Depth averaged power assessment to FVCOM.Variables.-'   
 
+    def depth_averaged_power_sweep(self, parameters, debug=False):
+        """
+        This function compares tidal turbines over the domain with the
+        depth averaged flow, in one pass over the velocity data.
+
+        Inputs:
+        ------
+          - parameters = turbine parameters, list of dictionaries with
+                         the keywords of depth_averaged_power_assessment,
+                         ex: [{'cut_in': 0.8}, {'cut_in': 1.2, 'tsr': 4.0}].
+                         Missing keywords take their default values
+
+        Outputs:
+        -------
+          - mean = mean power in W/m2, 2D array (turbine, nele)
+          - factor = capacity factor, 2D array (turbine, nele)
+
+        Notes:
+        -----
+          - the capacity factor is the mean power over the rated power,
+            i.e. the power at cut-out speed
+          - hori_velo_norm is used if already computed, ua and va otherwise
+        """
+        debug = (debug or self._debug)
+        if debug: print "Computing depth averaged power sweep..."
+
+        if hasattr(self._var, 'hori_velo_norm'):
+            components = [self._var.hori_velo_norm]
+        else:
+            components = [self._var.ua, self._var.va]
+        mean, factor = power_sweep(components, parameters,
+                                   max_memory=self._max_memory)
+
+        if debug: print '...Passed'
+
+        return mean, factor
+
     def Harmonic_analysis_at_point(self, pt_lon, pt_lat,
                                    time_ind=[], t_start=[], t_end=[],
                                    elevation=True, velocity=False,
@@ -888,19 +984,15 @@ class FunctionsFvcom:
         '''
         debug = (debug or self._debug)
         #TR_comments: Add debug flag in Utide: debug=self._debug
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        index = locate(self._grid, pt_lon, pt_lat)[0]
         argtime = []
         if not time_ind==[]:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end,
-                                        self._var.matlabTime,
-                                        debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
         
         if velocity:
             time = self._var.matlabTime[:]
@@ -9,6 +9,12 @@ from datetime import datetime
 from datetime import timedelta
 from interpolation_utils import *
 from miscellaneous import *
+from time_axis import time_axis
+from spatial_index import spatial_index, locate
+from mesh_operators import gradient_operators, apply_operator
+from mesh_operators import node_to_element
+from read_utils import read_columns
+from turbine import power_series, power_sweep
 from BP_tools import *
 from shortest_element_path import *
 import time
@@ -30,8 +36,18 @@ class FunctionsFvcomThreeD:
         self._plot = plot
         self._History = History
         self._util = util
+        #Storage type and memory budget of the derived fields,
+        #see FVCOM dtype and max_memory options
+        self._dtype = getattr(variable, '_dtype', None)
+        self._max_memory = getattr(variable, '_max_memory', None)
         self.interpolation_at_point = self._util.interpolation_at_point
+        self.interpolation_at_points = self._util.interpolation_at_points
+        self.probe = self._util.probe
         self.hori_velo_norm = self._util.hori_velo_norm
+        self._evaluate = self._util._evaluate
+        self._allocate = self._util._allocate
+        self._operator = self._util._operator
+        self.gradient = self._util.gradient
 
         #Create pointer to FVCOM class
         variable = self._var
@@ -53,22 +69,16 @@ class FunctionsFvcomThreeD:
             start = time.time()
 
         print "Computing depth..."
-        #Compute depth      
-        size = self._grid.nele
-        size1 = self._grid.ntime
-        size2 = self._grid.nlevel
-        elc = np.zeros((size1, size))
-        hc = np.zeros((size))
-        siglay = np.zeros((size2, size))
+        #Compute depth at centers, i.e. mean of the 3 nodes
+        n2e = node_to_element(self._grid)
 
         try:
-            for ind, value in enumerate(self._grid.trinodes):
-                elc[:, ind] = np.mean(self._var.el[:, value], axis=1)
-                hc[ind] = np.mean(self._grid.h[value])
-                siglay[:,ind] = np.mean(self._grid.siglay[:,value],1)
-
-            zeta = self._var.el[:,:] + h[None,:]
-            dep = zeta[:,None,:]*siglay[None,:,:]
+            hc = apply_operator(n2e, self._grid.h[:])
+            siglay = apply_operator(n2e, self._grid.siglay[:])
+            zeta = self._operator([(n2e, self._var.el)], self._grid.ntime)
+            zeta += hc[None,:]
+            dep = self._evaluate('zeta*siglay', {'zeta': zeta[:,None,:],
+                                                 'siglay': siglay[None,:,:]})
         except MemoryError:
             print '---Data too large for machine memory---'
             print 'Tip: use ax or tx during class initialisation'
@@ -99,7 +109,7 @@ class FunctionsFvcomThreeD:
 
         Keywords:
         --------
-          - index = element index, interger. Use only if closest element
+          - index = element index, interger. Use only if containing element
                     index is already known
 
         Notes:
@@ -115,9 +125,7 @@ class FunctionsFvcomThreeD:
 
         #Finding index
         if index==[]:      
-            index = closest_point([pt_lon], [pt_lat],
-                                  self._grid.lonc,
-                                  self._grid.latc, debug=debug)[0]
+            index = locate(self._grid, pt_lon, pt_lat)[0]
 
         if not hasattr(self._grid, 'depth'):
             #Compute depth
@@ -227,14 +235,12 @@ class FunctionsFvcomThreeD:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
                 argtime = np.arange(t_start, t_end) 
 
-        # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        # Finding containing element
+        index = locate(self._grid, pt_lon, pt_lat)[0]
         #Compute depth
         depth = self.depth_at_point(pt_lon, pt_lat, index=index, debug=debug)
 
@@ -304,7 +310,8 @@ class FunctionsFvcomThreeD:
                 u = self._var.u[:]
                 v = self._var.v[:]
                 w = self._var.w[:]
-                vel = ne.evaluate('sqrt(u**2 + v**2 + w**2)')
+                vel = self._evaluate('sqrt(u**2 + v**2 + w**2)',
+                               {'u': u, 'v': v, 'w': w})
             except MemoryError:
                 print '---Data too large for machine memory---'
                 print 'Tip: use ax or tx during class initialisation'
@@ -315,7 +322,7 @@ class FunctionsFvcomThreeD:
                 #Computing velocity norm
                 u = self._var.u[:]
                 v = self._var.v[:]
-                vel = ne.evaluate('sqrt(u**2 + v**2)')
+                vel = self._evaluate('sqrt(u**2 + v**2)', {'u': u, 'v': v})
             except MemoryError:
                 print '---Data too large for machine memory---'
                 print 'Tip: use ax or tx during class initialisation'
@@ -368,9 +375,9 @@ class FunctionsFvcomThreeD:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
 
         try:
             if not hasattr(self._var, 'velo_norm'):             
@@ -387,10 +394,8 @@ class FunctionsFvcomThreeD:
                 vel = self._var.velo_norm
 
 
-        # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        # Finding containing element
+        index = locate(self._grid, pt_lon, pt_lat)[0]
 
         #Computing horizontal velocity norm
         if debug:
@@ -453,10 +458,8 @@ class FunctionsFvcomThreeD:
         if debug:
             print 'Computing flow directions at point...'
 
-        # Finding closest point
-        index = closest_point([pt_lon], [pt_lat],
-                              self._grid.lonc,
-                              self._grid.latc, debug=debug)[0]
+        # Finding containing element
+        index = locate(self._grid, pt_lon, pt_lat)[0]
 
         # Find time interval to work in
         argtime = []
@@ -464,9 +467,9 @@ class FunctionsFvcomThreeD:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
         
         #Checking if dir_flow already computed
         if not hasattr(self._var, 'flow_dir'):
@@ -521,7 +524,8 @@ class FunctionsFvcomThreeD:
         try:
             u = self._var.u
             v = self._var.v
-            dirFlow = np.rad2deg(np.arctan2(V,U))
+            dirFlow = self._evaluate('arctan2(v, u)', {'u': u, 'v': v})
+            np.rad2deg(dirFlow, out=dirFlow)
         except MemoryError:
             print '---Data too large for machine memory---'
             print 'Tip: use ax or tx during class initialisation'
@@ -545,49 +549,17 @@ class FunctionsFvcomThreeD:
      
         Notes:
         -----
-          - Can take time over the full domain
+          - the d/dx and d/dy operators of the grid are applied to all the
+            time steps and levels at once, by chunks within max_memory
         """
         debug = (debug or self._debug)
         if debug:
             print 'Computing vorticity...'
             start = time.time()
 
-        t = arange(self._grid.ntime)  
-
-        #Surrounding elements
-        n1 = self._grid.triele[:,0]
-        n2 = self._grid.triele[:,1]
-        n3 = self._grid.triele[:,2]
-        #TR comment: not quiet sure what this step does
-        n1[np.where(n1==0)[0]] = self._grid.trinodes.shape[1]
-        n2[np.where(n2==0)[0]] = self._grid.trinodes.shape[1]
-        n3[np.where(n3==0)[0]] = self._grid.trinodes.shape[1]
-        if debug:
-            end = time.time()
-            print "Check element=0, computation time in (s): ", (end - start)
-            print "start np.multiply" 
-
-        x0 = self._grid.xc
-        y0 = self._grid.yc
-        
-        dvdx = np.zeros((self._grid.ntime,self._grid.nlevel,self._grid.nele))
-        dudy = np.zeros((self._grid.ntime,self._grid.nlevel,self._grid.nele))
-
-        j=0
-        for i in t:
-            dvdx[j,:,:] = np.multiply(self._grid.a1u[0,:], self._var.v[i,:,:]) \
-                        + np.multiply(self._grid.a1u[1,:], self._var.v[i,:,n1]) \
-                        + np.multiply(self._grid.a1u[2,:], self._var.v[i,:,n2]) \
-                        + np.multiply(self._grid.a1u[3,:], self._var.v[i,:,n3])
-            dudy[j,:,:] = np.multiply(self._grid.a2u[0,:], self._var.u[i,:,:]) \
-                        + np.multiply(self._grid.a2u[1,:], self._var.u[i,:,n1]) \
-                        + np.multiply(self._grid.a2u[2,:], self._var.u[i,:,n2]) \
-                        + np.multiply(self._grid.a2u[3,:], self._var.u[i,:,n3])
-            j+=1
-        if debug:
-            print "loop number ", i
-
-        vort = dvdx - dudy
+        ddx, ddy = gradient_operators(self._grid)
+        vort = self._operator([(ddx, self._var.v), (-ddy, self._var.u)],
+                              self._grid.ntime)
 
         # Add metadata entry
         self._var.vorticity = vort
@@ -604,7 +576,7 @@ class FunctionsFvcomThreeD:
      
         Outputs:
         -------
-          - vort = horizontal vorticity (1/s), 2D array (time, nele)
+          - vort = horizontal vorticity (1/s), 3D array (time, level, nele)
 
         Keywords:
         -------
@@ -628,48 +600,18 @@ class FunctionsFvcomThreeD:
             t = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                t = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                t = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                t = arange(t_start, t_end)
+                t = np.arange(t_start, t_end)
         else:
-            t = arange(self._grid.ntime)  
+            t = np.arange(self._grid.ntime)  
 
         #Checking if vorticity already computed
         if not hasattr(self._var, 'vorticity'): 
-            #Surrounding elements
-            n1 = self._grid.triele[:,0]
-            n2 = self._grid.triele[:,1]
-            n3 = self._grid.triele[:,2]
-            #TR comment: not quiet sure what this step does
-            n1[np.where(n1==0)[0]] = self._grid.trinodes.shape[1]
-            n2[np.where(n2==0)[0]] = self._grid.trinodes.shape[1]
-            n3[np.where(n3==0)[0]] = self._grid.trinodes.shape[1]
-            if debug:
-                end = time.time()
-                print "Check element=0, computation time in (s): ", (end - start)
-                print "start np.multiply" 
-
-            x0 = self._grid.xc
-            y0 = self._grid.yc
-        
-            dvdx = np.zeros((t.shape[0],self._grid.nlevel,self._grid.nele))
-            dudy = np.zeros((t.shape[0],self._grid.nlevel,self._grid.nele))
-
-            j=0
-            for i in t:
-                dvdx[j,:,:] = np.multiply(self._grid.a1u[0,:], self._var.v[i,:,:]) \
-                          + np.multiply(self._grid.a1u[1,:], self._var.v[i,:,n1]) \
-                          + np.multiply(self._grid.a1u[2,:], self._var.v[i,:,n2]) \
-                          + np.multiply(self._grid.a1u[3,:], self._var.v[i,:,n3])
-                dudy[j,:,:] = np.multiply(self._grid.a2u[0,:], self._var.u[i,:,:]) \
-                          + np.multiply(self._grid.a2u[1,:], self._var.u[i,:,n1]) \
-                          + np.multiply(self._grid.a2u[2,:], self._var.u[i,:,n2]) \
-                          + np.multiply(self._grid.a2u[3,:], self._var.u[i,:,n3])
-                j+=1
-            if debug:
-                print "loop number ", i
-
-            vort = dvdx - dudy
+            t = np.asarray(t)
+            ddx, ddy = gradient_operators(self._grid)
+            vort = self._operator([(ddx, self._var.v), (-ddy, self._var.u)],
+                                  t.shape[0], time=t)
         else:
             vort = self._var.vorticity[t[:],:,:]
 
@@ -700,7 +642,7 @@ class FunctionsFvcomThreeD:
         if debug: print "Computing powers of velo norm..."
         u = self._var.velo_norm
         if debug: print "Computing pd..."
-        pd = ne.evaluate('0.5*1025.0*(u**3)')  
+        pd = self._evaluate('0.5*1025.0*(u**3)', {'u': u})
 
         # Add metadata entry
         self._var.power_density = pd
@@ -739,8 +681,9 @@ class FunctionsFvcomThreeD:
           - b0 = dcpc curve parameter, float
         Notes:
         -----
-          - This may take some time to compute depending on the size
-            of the data set
+          - pd is set to 0 below the cut-in power and to the cut-out power
+            above, see turbine.power_series
+          - computed by chunks of time steps within the memory budget
         """
         debug = (debug or self._debug)
         if debug: print "Computing power assessment..."
@@ -748,49 +691,61 @@ class FunctionsFvcomThreeD:
         if not hasattr(self._var, 'velo_norm'):
             if debug: print "Computing velo norm..."
             self.velo_norm(debug=debug)
-        if debug: print "Computing powers of velo norm..."
         u = self._var.velo_norm
-        if debug: print "Computing pc and dcpc..."
-        pc = ne.evaluate('a4*(u**4) + a3*(u**3) + a2*(u**2) + a1*u + a0')
-        dcpc = ne.evaluate('b2*(tsr**2) + b1*tsr + b0')
-        if debug: print "Computing pd..."
-        pd = ne.evaluate('pc*dcpc*0.5*1025.0*(u**3)')
-
-        if debug: print "finding cut-in..."
-        u = cut_in
-        pcin = ne.evaluate('a4*(u**4) + a3*(u**3) + a2*(u**2) + a1*u + a0')
-        dcpcin = ne.evaluate('b2*(tsr**2) + b1*tsr + b0')
-        pdin = ne.evaluate('pcin*dcpcin*0.5*1025.0*(u**3)')
-        #TR comment huge bottleneck here
-        #ind = np.where(pd<pdin)[0]
-        #if not ind.shape[0]==0:
-        #    pd[ind] = 0.0
-        for i in range(pd.shape[0]):
-            for j in range(pd.shape[1]):
-                for k in range(pd.shape[2]):
-                    if pd[i,j,k] < pdin:
-                       pd[i,j,k] = 0.0 
-
-        if debug: print "finding cut-out..."
-        u = cut_out
-        pcout = ne.evaluate('a4*(u**4) + a3*(u**3) + a2*(u**2) + a1*u + a0')
-        dcpcout = ne.evaluate('b2*(tsr**2) + b1*tsr + b0')
-        pdout = ne.evaluate('pcout*dcpcout*0.5*1025.0*(u**3)')
-        #TR comment huge bottleneck here
-        #ind = np.where(pd>pdout)[0]
-        #if not ind.shape[0]==0:
-        #    pd[ind] = pdout
-        for i in range(pd.shape[0]):
-            for j in range(pd.shape[1]):
-                for k in range(pd.shape[2]):
-                    if pd[i,j,k] > pdout:
-                       pd[i,j,k] = pdout       
+        parameters = {'cut_in': cut_in, 'cut_out': cut_out, 'tsr': tsr,
+                      'a4': a4, 'a3': a3, 'a2': a2, 'a1': a1, 'a0': a0,
+                      'b2': b2, 'b1': b1, 'b0': b0}
+        dtype = self._dtype
+        if dtype is None:
+            dtype = float
+        if debug: print "Computing pd with cut-in and out..."
+        pd = power_series([u], parameters, dtype=dtype,
+                          max_memory=self._max_memory)
 
         # Add metadata entry
         self._var.power_assessment = pd
         self._History.append('power assessment computed')
         print '-Power assessment to FVCOM.Variables.-'  
 
+    def power_sweep(self, parameters, debug=False):
+        """
+        This function compares tidal turbines over the domain and the
+        levels, in one pass over the velocity data.
+
+        Inputs:
+        ------
+          - parameters = turbine parameters, list of dictionaries with
+                         the keywords of power_assessment,
+                         ex: [{'cut_in': 0.8}, {'cut_in': 1.2, 'tsr': 4.0}].
+                         Missing keywords take their default values
+
+        Outputs:
+        -------
+          - mean = mean power in W/m2, 3D array (turbine, level, nele)
+          - factor = capacity factor, 3D array (turbine, level, nele)
+
+        Notes:
+        -----
+          - the capacity factor is the mean power over the rated power,
+            i.e. the power at cut-out speed
+          - velo_norm is used if already computed, u, v and w otherwise
+        """
+        debug = (debug or self._debug)
+        if debug: print "Computing power sweep..."
+
+        if hasattr(self._var, 'velo_norm'):
+            components = [self._var.velo_norm]
+        elif hasattr(self._var, 'w'):
+            components = [self._var.u, self._var.v, self._var.w]
+        else:
+            components = [self._var.u, self._var.v]
+        mean, factor = power_sweep(components, parameters,
+                                   max_memory=self._max_memory)
+
+        if debug: print '...Passed'
+
+        return mean, factor
+
     def _vertical_slice(self, var, start_pt, end_pt,
                         time_ind=[], t_start=[], t_end=[],
                         title='Title', cmax=[], cmin=[], debug=False):
@@ -826,7 +781,7 @@ class FunctionsFvcomThreeD:
             lons = [start_pt[0], end_pt[0]]
             lats = [start_pt[1], end_pt[1]]
             #Finding the closest elements to start and end points
-            ind = closest_point(lons, lats, self._grid.lonc, self._grid.latc, debug)
+            ind = spatial_index(self._grid).nearest(lons, lats)
 
             #Finding the shortest path between start and end points
             if debug : print "Computing shortest path..."
@@ -846,30 +801,28 @@ class FunctionsFvcomThreeD:
                 argtime = time_ind
             elif not t_start==[]:
                 if type(t_start)==str:
-                    argtime = time_to_index(t_start, t_end,
-                                            self._var.matlabTime, debug=debug)
+                    argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
                 else:
-                    argtime = arange(t_start, t_end)
+                    argtime = np.arange(t_start, t_end)
  
             #Extract along line
             ele=np.asarray(el[:])[0,:]
             varP = var[:,ele]
             # Depth along line
             if debug : print "Computing depth..."
-            depth = np.zeros((self._grid.ntime, self._grid.nlevel, ele.shape[0]))
-            I=0
-            for ind in ele:
-                value = self._grid.trinodes[ind]
-                h = np.mean(self._grid.h[value])
-                zeta = np.mean(self._var.el[:,value],1) + h
-                siglay = np.mean(self._grid.siglay[:,value],1)
-                depth[:,:,I] =  zeta[:,None]*siglay[None,:]
-                I+=1
+            #Node to element operator restricted to the line
+            n2e = node_to_element(self._grid)[ele]
+            nodes = np.unique(n2e.indices)
+            n2e = n2e[:, nodes]
+            h = apply_operator(n2e, self._grid.h[:][nodes])
+            zeta = apply_operator(n2e, read_columns(self._var.el, nodes)) + h
+            siglay = apply_operator(n2e, self._grid.siglay[:][:,nodes])
             # Average depth over time
             if not argtime==[]:
-                depth = np.mean(depth[argtime,:,:], 0)
+                zeta = np.mean(zeta[argtime,:], 0)
             else:
-                depth = np.mean(depth, 0)
+                zeta = np.mean(zeta, 0)
+            depth = zeta[None,:]*siglay
               
             # Compute distance along line
             x = self._grid.xc[ele]
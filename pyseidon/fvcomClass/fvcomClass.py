@@ -11,7 +11,7 @@ from utide import ut_solv, ut_reconstr
 from scipy.io import netcdf
 from scipy.io import savemat
 from scipy.io import loadmat
-from pydap.client import open_url
+from opendap_utils import open_url, stats, transfer_summary
 import cPickle as pkl
 import copy
 
@@ -21,9 +21,15 @@ sys.path.append('../utilities/')
 #Utility import
 from shortest_element_path import shortest_element_path
 from object_from_dict import ObjectFromDict
+from lazy_attributes import LazyAttributes
+from memory_utils import estimate
+from extractor import extract_stations
+from miscellaneous import _load_nc
+from multi_file import is_multi, MultiDataset
 
 #Local import
 from variablesFvcom import _load_var, _load_grid
+from regioner import REGIONS
 from functionsFvcom import *
 from functionsFvcomThreeD import *
 from plotsFvcom import *
@@ -41,6 +47,9 @@ Description:
     FVCOM._|_Utils2D. = set of useful functions and methods for 2D and 3D runs
            |_Utils3D. = set of useful functions and methods for 3D runs
            |_Plots. = plotting functions
+           |_Load_var = reads variables at once
+           |_estimate = memory needed before loading
+           |_extract_stations = virtual moorings written as Station file
            |_Save_as = "save as" methods
 
 Inputs:
@@ -50,6 +59,9 @@ Inputs:
                Note that the file can be a pickle file (i.e. *.p)
                or a netcdf file (i.e. *.nc).
                Additionally, either a file path or a OpenDap url could be used. 
+               A folder or a glob pattern of *.nc files of the same run,
+               ex: './path_to_FVCOM_output_folder/dngrid_00*.nc', is seen as
+               a single file with one time axis.
 
 Options:
 -------
@@ -58,6 +70,10 @@ Options:
                  minimun latitude, maximum latitude]
          or use one of the following pre-defined region:
              ax = 'GP', 'PP', 'DG' or 'MP'
+         or a polygon, list of (longitude, latitude) vertices:
+             ax = [(-66.35, 44.23), (-66.26, 44.25), (-66.30, 44.33)]
+         or a list of boxes, polygons and pre-defined regions,
+         or a precomputed element mask, boolean array (nele).
          Note that this option permits to extract partial data from the overall file
          and therefore reduce memory and cpu use.
 
@@ -67,6 +83,30 @@ Options:
          Note that this option permits to extract partial data from the overall file
          and therefore reduce memory and cpu use.
 
+  - variables = variables to load, list of strings,
+                ex: variables = ['el', 'ua', 'va'].
+                All the available ones by default.
+  - exclude = variables not to load, list of strings, ex: exclude = ['w']
+         Note that these options permit to skip 3D variables in 3D runs
+         and therefore reduce memory use.
+
+  - dtype = storage type of the loaded and derived fields,
+            ex: dtype = np.float32, i.e. FVCOM output precision.
+            By default, fields read within ax or tx are float64.
+         Note that np.float32 halves memory use. Means and sums are still
+         computed in float64.
+
+  - workers = number of concurrent reads, integer.
+              Blocks of a variable, and the variables loaded together
+              by Load_var, are read on a pool of 'workers' threads.
+              Note that this option mostly speeds up OpenDap access.
+
+  - max_memory = memory budget per field in bytes, integer,
+                 ex: max_memory = 4*1024**3.
+                 Larger loaded and derived fields are stored in temporary
+                 files and derived fields are computed by chunks of time.
+         Note that FVCOM.estimate gives the memory needed beforehand.
+
 Notes:
 -----
   Throughout the package, the following conventions apply:
@@ -75,9 +115,18 @@ Notes:
   - Directions = in degrees, between -180 and 180 deg., i.e. 0=East, 90=North,
                  +/-180=West, -90=South
   - Depth = 0m is the free surface and depth is negative
+  - Variables are only read from file when first accessed,
+    ex: testFvcom.Variables.el
+  - OpenDap answers may be cached on disk and shared by every object
+    opening the same url, see cache_on, cache_off and invalidate in
+    opendap_utils. The cache is off by default
+  - Nearest elements and nodes are found with a spatial index of the Grid,
+    built on first use and kept by Save_as,
+    ex: spatial_index(testFvcom.Grid).nearest(lons, lats, k=3)
     '''
 
-    def __init__(self, filename, ax=[], tx=[], debug=False):
+    def __init__(self, filename, ax=[], tx=[], variables=[], exclude=[],
+                 dtype=None, workers=1, max_memory=None, debug=False):
         ''' Initialize FVCOM class.'''
         self._debug = debug
         if debug:
@@ -99,6 +148,8 @@ Notes:
                     self.Data = open_url(data['Origin'])
                     #Create fake attribut to be consistent with the rest of the code
                     self.Data.variables = self.Data
+                elif is_multi(self._origin_file):
+                    self.Data = MultiDataset(self._origin_file)
                 else:
                     #WB_Alternative: self.Data = sio.netcdf.netcdf_file(filename, 'r')
                     #WB_comments: scipy has causes some errors, and even though can be
@@ -109,9 +160,15 @@ Notes:
                 print "the original *.nc file has not been found"
                 pass
 
-        #Loading netcdf file         
-        elif filename.endswith('.nc'):
-            if filename.startswith('http'):
+        #Loading netcdf file(s)
+        elif filename.endswith('.nc') or is_multi(filename):
+            transfer = stats()
+            if is_multi(filename):
+                #Several files of the same run seen as one
+                print "Retrieving data from " + filename + " ..."
+                self.Data = MultiDataset(filename, tx=tx, debug=debug)
+                print str(len(self.Data.files)) + " files found"
+            elif filename.startswith('http'):
                 #Look for file through OpenDAP server
                 print "Retrieving data through OpenDap server..."
                 self.Data = open_url(filename)
@@ -141,11 +198,20 @@ Notes:
                                            self.Grid,
                                            tx,
                                            self.History,
+                                           variables=variables,
+                                           exclude=exclude,
+                                           dtype=dtype,
+                                           workers=workers,
+                                           max_memory=max_memory,
                                            debug=self._debug)
+                #Cached answers are reported, they may be outdated
+                if filename.startswith('http') and \
+                   (debug or stats()['hits'] > transfer['hits']):
+                    print "OpenDap transfer: " + transfer_summary(transfer)
             except MemoryError:
                 print '---Data too large for machine memory---'
                 print 'Tip: use ax or tx during class initialisation'
-                print '---  to use partial data'
+                print '---  to use partial data, or max_memory'
                 raise
 
         elif filename.endswith('.mat'):
@@ -249,6 +315,118 @@ Notes:
         return newself  
    
     #Methods
+    @staticmethod
+    def estimate(filename, ax=[], tx=[], variables=[], exclude=[],
+                 dtype=None, debug=False):
+        """
+        This method estimates the memory needed by the loaded and derived
+        fields from the file dimensions, without loading them.
+
+        Inputs:
+        ------
+          - filename = path to *.nc file(s) or OpenDap url, string
+
+        Outputs:
+        -------
+          - sizes = bytes needed per field, dictionary
+
+        Keywords:
+        --------
+          - ax, tx, variables, exclude, dtype = see FVCOM class options
+
+        Notes:
+        -----
+          - ex: sizes = FVCOM.estimate('./path/filename.nc', tx=[...])
+          - only the coordinates and time are read, for ax and tx
+        """
+        if is_multi(filename):
+            data = MultiDataset(filename)
+        else:
+            data = _load_nc(filename)
+        if type(ax)==str and ax in REGIONS:
+            ax = REGIONS[ax]
+        sizes = estimate(data, ax=ax, tx=tx, variables=variables,
+                         exclude=exclude, dtype=dtype, debug=debug)
+        total = 0
+        for key in sorted(sizes, key=sizes.get, reverse=True):
+            print key.ljust(28) + str(round(sizes[key] / 1024**2, 2)) + ' MB'
+            total += sizes[key]
+        print 'Total'.ljust(28) + str(round(total / 1024**2, 2)) + ' MB'
+
+        return sizes
+
+    @staticmethod
+    def extract_stations(filename, pt_lons, pt_lats, output, names=[],
+                         tx=[], variables=[], exclude=[], max_memory=None,
+                         debug=False):
+        """
+        This method interpolates variables at given locations, i.e. virtual
+        moorings, and writes them as a Station file, without loading the
+        variables.
+
+        Inputs:
+        ------
+          - filename = path to *.nc file(s) or OpenDap url, string
+          - pt_lons = longitudes in decimal degrees East, list of floats
+          - pt_lats = latitudes in decimal degrees North, list of floats
+          - output = path to the station file to write, string
+
+        Keywords:
+        --------
+          - names = station names, list of strings
+          - tx, variables, exclude, max_memory = see FVCOM class options
+
+        Notes:
+        -----
+          - ex: FVCOM.extract_stations('./path/run/', lons, lats,
+                                       './path/moorings.nc', tx=[...])
+                moorings = Station('./path/moorings.nc')
+          - the files are read by blocks of time steps and only the
+            columns needed by the points, see extractor
+        """
+        if is_multi(filename):
+            data = MultiDataset(filename, tx=tx, debug=debug)
+        else:
+            data = _load_nc(filename)
+        grid = _load_grid(data, [], [], debug=debug)
+        extract_stations(data, grid, pt_lons, pt_lats, output, names=names,
+                         tx=tx, variables=variables, exclude=exclude,
+                         max_memory=max_memory, debug=debug)
+        print '-Stations written in ' + output + '-'
+
+    def Load_var(self, variables=[], debug=False):
+        """
+        This method reads variables from file at once instead of on first
+        access. Their reads are shared by the pool of 'workers' threads
+        (see FVCOM class options).
+
+        Keywords:
+        --------
+          - variables = variable names, list of strings,
+                        ex: ['ua', 'va', 'el']. All by default
+        """
+        debug = debug or self._debug
+        if not isinstance(self.Variables, LazyAttributes):
+            return
+        if variables==[]:
+            variables = self.Variables._pending()
+        if debug:
+            print "Loading " + str(variables) + "..."
+        transfer = stats()
+        try:
+            self.Variables._load_all(variables)
+        except MemoryError:
+            print '---Data too large for machine memory---'
+            print 'Tip: use ax or tx during class initialisation'
+            print '---  to use partial data, or max_memory'
+            raise
+        #Cached answers are reported, they may be outdated
+        if self._origin_file.startswith('http') and \
+           (debug or stats()['hits'] > transfer['hits']):
+            print "OpenDap transfer: " + transfer_summary(transfer)
+        if debug:
+            print '...Passed'
+
     def Save_as(self, filename, fileformat='pickle', debug=False):
         """
         This method saves the current FVCOM structure as:
@@ -274,6 +452,12 @@ Notes:
             lat = self.Grid.lat[:]
             self.Grid._ax = [lon.min(), lon.max(),
                              lat.min(), lat.max()]
+        #Force loading of the variables not accessed yet
+        for sub in [self.Variables, self.Grid]:
+            if isinstance(sub, LazyAttributes):
+                if debug:
+                    print "Force loading for " + str(sub._pending())
+                sub._load_all()
         #Save as different formats
         if fileformat=='pickle':
             filename = filename + ".p"
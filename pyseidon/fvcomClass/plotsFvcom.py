@@ -10,6 +10,7 @@ import seaborn
 from windrose import WindroseAxes
 from interpolation_utils import *
 from miscellaneous import depth_at_FVCOM_element as depth_at_ind
+from spatial_index import triangulation
 
 class PlotsFvcom:
     """
@@ -62,15 +63,10 @@ class PlotsFvcom:
                              lat.min(), lat.max()]
         bb = self._grid._ax  
 
-        if not hasattr(self._grid, 'triangle'):        
-            # Mesh triangle
-            if debug:
-                print "Computing triangulation..."
-            trinodes = self._grid.trinodes 
-            tri = Tri.Triangulation(lon, lat, triangles=trinodes)
-            self._grid.triangle = tri
-        else:
-            tri = self._grid.triangle
+        # Mesh triangle
+        if debug:
+            print "Computing triangulation..."
+        tri = triangulation(self._grid)
 
         #setting limits and levels of colormap
         if cmin==[]:
@@ -5,14 +5,17 @@ from __future__ import division
 #from jdcal import gcal2jd
 import numpy as np
 import matplotlib.tri as Tri
-from itertools import groupby
-from operator import itemgetter
 #Local import
 from regioner import *
-from miscellaneous import time_to_index
+from time_axis import TimeAxis
 from miscellaneous import mattime_to_datetime
+from miscellaneous import select_variables
+from lazy_attributes import LazyAttributes
+from read_utils import plan_time_blocks, read_columns, run_tasks
+from memory_utils import allocate
+from multi_file import MultiVariable
 
-class _load_var:
+class _load_var(LazyAttributes):
     """
 'Variables' subset in FVCOM class contains the numpy arrays:
 -----------------------------------------------------------
@@ -41,8 +44,16 @@ Some others shall be generated as methods are being called, ex:
                   |               3D array (ntime, nlevel, nele)
                   |_vorticity...            
     """
-    def __init__(self, data, grid, tx, History, debug=False):
+    def __init__(self, data, grid, tx, History, variables=[], exclude=[],
+                 dtype=None, workers=1, max_memory=None, debug=False):
         self._debug = debug
+        self._workers = workers
+        #Memory budget in bytes, larger fields are stored on disk
+        self._max_memory = max_memory
+        #Storage type of the loaded and derived fields
+        self._dtype = None
+        if not dtype is None:
+            self._dtype = np.dtype(dtype)
         #Pointer to History
         self._History = History
         History = self._History
@@ -52,7 +63,17 @@ Some others shall be generated as methods are being called, ex:
         kwl3D = ['ww', 'u', 'v', 'gls', 'tke']
         #List of aliaSes
         al2D = ['ua', 'va', 'el']
-        al3D = ['u', 'u', 'v', 'gls', 'tke'] 
+        al3D = ['w', 'u', 'v', 'gls', 'tke']
+
+        #Restrict to the requested variables
+        if not (variables==[] and exclude==[]):
+            unknown = [v for v in variables + exclude if not v in al2D + al3D]
+            if not unknown==[]:
+                print "---Unknown variables: " + str(unknown) + "---"
+            kwl2D, al2D = select_variables(kwl2D, al2D, variables, exclude)
+            kwl3D, al3D = select_variables(kwl3D, al3D, variables, exclude)
+            text = 'Variables = ' + str(al2D + al3D)
+            self._History.append(text)
 
         #Check if time period defined
         self.julianTime = data.variables['time']      
@@ -68,426 +89,127 @@ Some others shall be generated as methods are being called, ex:
             # get time and adjust it to matlab datenum
             self.julianTime = data.variables['time'][ts:te]
             self.matlabTime = self.julianTime + 678942.0
+            #Time index of the period
+            self._time = TimeAxis(self.matlabTime)
             #Add time dimension to grid variables
             grid.ntime = self.julianTime.shape[0]
             if debug: print "ntime: ", grid.ntime
             if debug: print "region_t shape: ", region_t.shape
-
-            #Check if bounding box has been defined
-            if grid._ax==[]:
-                if debug:
-                    print 'Loading variables...'
-                #Check if OpenDap variables or not
-                if type(data.variables).__name__=='DatasetType':
-                    #loading hori data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl2D, al2D):
-                        try:
-                            setattr(self, aliaS, data.variables[key].data[ts:te,:])
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Horizontal variables are missing---"
-                    self._3D = False 
-                    
-                    #loading verti data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl3D, al3D):
-                        try:
-                            setattr(self, aliaS, data.variables[key].data[ts:te,:,:])
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Vertical variables are missing---"
-                    else:
-                        self._3D = True
-
-                #Not OpenDap
-                else:
-                    #loading hori data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl2D, al2D):
-                        try:
-                            if key=='zeta':
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nnode)))
-                            else:
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nele)))
-                            I = 0
-                            for i in region_t:
-                                #TR comment: looping on time indices is a trick from
-                                #            Mitchell to improve loading time
-                                #TR comment: no idea why I have to transpose here but
-                                #            I do !!
-                                getattr(self, aliaS)[I,:] =\
-                                        np.transpose(data.variables[key].data[i,:])
-                                I += 1
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Horizontal variables are missing---"
-                    self._3D = False 
-                    
-                    #loading verti data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl3D, al3D):
-                        try:
-                            testKey = data.variables[key]
-                            del testKey
-                            setattr(self, aliaS,
-                                    np.zeros((grid.ntime,grid.nlevel, grid.nele)))
-                            I = 0
-                            for i in region_t:
-                                #TR comment: looping on time indices is a trick from
-                                #            Mitchell to improve loading time
-                                #TR comment: no idea why I have to transpose here but
-                                #            I do !!
-                                getattr(self, aliaS)[I,:,:] =\
-                                        np.transpose(data.variables[key].data[i,:,:])
-                                I += 1
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Vertical variables are missing---"
-                    else:
-                        self._3D = True 
-
-            #Time period defined and region defined           
-            else:
-                if debug:
-                    print 'Loading variables...'
-                #TR comment: very slow...gonna need optimisation down the line  
-                #Bounding box
-                region_e = grid._element_index
-                region_n = grid._node_index
-                #Redefine variables in bounding box & time period
-                #Check if OpenDap variables or not
-                if type(data.variables).__name__=='DatasetType':
-                    #Special loading for zeta
-                    H = 0 #local counter
-                    key = kwl2D.pop(2)
-                    aliaS = al2D.pop(2)
-                    for k, g in groupby(enumerate(region_n), lambda (i,x):i-x):
-                        ID = map(itemgetter(1), g)
-                        if debug: print 'Index bound: ' +\
-                            str(ID[0]) + '-' + str(ID[-1]+1)
-                        if H==0:
-                            setattr(self, aliaS,
-                                    data.variables[key].data[ts:te,ID[0]:(ID[-1]+1)])
-                            H=1
-                        else:
-                            setattr(self, aliaS,
-                            np.hstack((getattr(self, aliaS),
-                            data.variables[key].data[ts:te,ID[0]:(ID[-1]+1)])))
-                    #loading hori data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl2D, al2D):
-                        try:
-                            H = 0 #local counter
-                            for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                                ID = map(itemgetter(1), g)
-                                if debug: print 'Index bound: ' +\
-                                          str(ID[0]) + '-' + str(ID[-1]+1)
-                                if H==0:
-                                    setattr(self, aliaS,
-                                    data.variables[key].data[ts:te,ID[0]:(ID[-1]+1)])
-                                    H=1
-                                else:
-                                    setattr(self, aliaS,
-                                    np.hstack((getattr(self, aliaS),
-                                    data.variables[key].data[ts:te,ID[0]:(ID[-1]+1)])))
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Horizontal variables are missing---"
-                    self._3D = False 
-                    
-                    #loading verti data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl3D, al3D):
-                        try:
-                            H = 0 #local counter
-                            for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                                ID = map(itemgetter(1), g)
-                                if debug: print 'Index bound: ' +\
-                                          str(ID[0]) + '-' + str(ID[-1]+1)
-                                if H==0:
-                                    setattr(self, aliaS, data.variables[key].data\
-                                                       [ts:te,:,ID[0]:(ID[-1]+1)])
-                                    H=1
-                                else:
-                                    setattr(self, aliaS,
-                                    np.dstack((getattr(self, aliaS),
-                                    data.variables[key].data[ts:te,:,ID[0]:(ID[-1]+1)])))
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Vertical variables are missing---"
-                    else:
-                         self._3D = True
-
-                #Not OpenDap
-                else:
-                    #loading hori data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl2D, al2D):
-                        try:
-                            if key=='zeta':
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nnode)))
-                                I = 0
-                                for i in region_t:
-                                    #TR comment: looping on time indices is a trick from
-                                    #            Mitchell to improve loading time
-                                    #TR comment: no idea why I have to transpose here but
-                                    #            I do !!
-                                    getattr(self, aliaS)[I,:] =\
-                                    np.transpose(data.variables[key].data[i,region_n])
-                                    I += 1
-                            else:
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nele)))
-                                I = 0
-                                for i in region_t:
-                                    #TR comment: looping on time indices is a trick from
-                                    #            Mitchell to improve loading time
-                                    #TR comment: no idea why I have to transpose here but
-                                    #            I do !!
-                                    getattr(self, aliaS)[I,:] =\
-                                    np.transpose(data.variables[key].data[i,region_e])
-                                    I += 1
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Horizontal variables are missing---"
-                    self._3D = False 
-                    
-                    #loading verti data
-                    keyCount = 0
-                    for key in zip(kwl3D, al3D):
-                        try:
-                            testKey = data.variables[key]
-                            del testKey
-                            setattr(self, alias,
-                            np.zeros((grid.ntime,grid.nlevel, grid.nele)))
-                            I=0
-                            for i in region_t:
-                                #TR comment: looping on time indices is a trick from
-                                #            Mitchell to improve loading time
-                                #TR comment: no idea why I have to transpose here but
-                                #            I do !!
-                                getattr(self, aliaS)[I,:,:] =\
-                                np.transpose(data.variables[key].data[i,:,region_e])
-                                I += 1
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Vertical variables are missing---"
-                    else:
-                        self._3D = True 
-  
         #No time period define    
         else:
+            region_t = []
             # get time and adjust it to matlab datenum
-            self.julianTime = data.variables['time'].data
+            self.julianTime = data.variables['time'][:]
             self.matlabTime = self.julianTime[:] + 678942.0
+            #Time index, see time_axis
+            self._time = TimeAxis(self.matlabTime)
             #-Append message to History field
             start = mattime_to_datetime(self.matlabTime[0])
             end = mattime_to_datetime(self.matlabTime[-1])
             text = 'Full temporal domain from ' + str(start) +\
-                   ' to ' + str(start)
+                   ' to ' + str(end)
             self._History.append(text)
             #Add time dimension to grid variables
             grid.ntime = self.julianTime.shape[0]
 
-            #Check if bounding box has been defined
-            if grid._ax==[]:
-                if debug:
-                    print 'Linking variables...'
+        #Variables are only read from file on first access
+        if debug:
+            print 'Linking variables...'
+        #loading hori data
+        keyCount = 0
+        for key, aliaS in zip(kwl2D, al2D):
+            try:
+                testKey = data.variables[key]
+                del testKey
+                self._register(aliaS, self._loader(data, grid, key, region_t))
+                keyCount +=1
+            except KeyError:
+                if debug: print key, " is missing !"
+                continue
+        if keyCount==0 and not kwl2D==[]:
+            print "---Horizontal variables are missing---"
+        self._3D = False 
 
-                #loading hori data
-                keyCount = 0
-                for key, aliaS in zip(kwl2D, al2D):
-                    try:
-                        setattr(self, aliaS, data.variables[key].data)
-                        keyCount +=1
-                    except KeyError:
-                        if debug: print key, " is missing !"
-                        continue
-                if keyCount==0:
-                    print "---Horizontal variables are missing---"
-                self._3D = False 
-                    
-                #loading verti data
-                keyCount = 0
-                for key, aliaS in zip(kwl3D, al3D):
-                    try:
-                        setattr(self, aliaS, data.variables[key].data)
-                        keyCount +=1
-                    except KeyError:
-                        if debug: print key, " is missing !"
-                        continue
-                if keyCount==0:
-                    print "---Vertical variables are missing---"
-                else:
-                    self._3D = True
+        #loading verti data
+        keyCount = 0
+        for key, aliaS in zip(kwl3D, al3D):
+            try:
+                testKey = data.variables[key]
+                del testKey
+                self._register(aliaS, self._loader(data, grid, key, region_t))
+                keyCount +=1
+            except KeyError:
+                if debug: print key, " is missing !"
+                continue
+        if keyCount==0:
+            if not kwl3D==[]:
+                print "---Vertical variables are missing---"
+        else:
+            self._3D = True
+        if debug:
+            print '...Passed'
 
-            #No time period defined but region defined
-            else:
-                if debug:
-                    print 'Loading variables...'
-                #TR comment: very slow...gonna need optimisation down the line   
-                #Bounding box
-                region_e = grid._element_index
-                region_n = grid._node_index
-                #Redefine variables in bounding box
-                #Check if OpenDap variables or not
-                if type(data.variables).__name__=='DatasetType':
-                    #loading hori data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl2D, al2D):
-                        #Special loading for zeta
-                        H = 0 #local counter
-                        if key == 'zeta':
-                            for k, g in groupby(enumerate(region_n), lambda (i,x):i-x):
-                                ID = map(itemgetter(1), g)
-                                if debug: print 'Index bound: ' +\
-                                    str(ID[0]) + '-' + str(ID[-1]+1)
-                                if H==0:
-                                    setattr(self, aliaS,
-                                    data.variables[key].data[:,ID[0]:(ID[-1]+1)])
-                                    H=1
-                                else:
-                                    setattr(self, aliaS,
-                                    np.hstack((getattr(self, aliaS),
-                                    data.variables[key].data[:,ID[0]:(ID[-1]+1)])))
-                        else:
-                            try:                        
-                                for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                                    ID = map(itemgetter(1), g)
-                                    if debug: print 'Index bound: ' +\
-                                              str(ID[0]) + '-' + str(ID[-1]+1)
-                                    if H==0:
-                                        setattr(self, aliaS,
-                                                data.variables[key].\
-                                                data[:,ID[0]:(ID[-1]+1)])
-                                        H=1
-                                    else:
-                                        setattr(self, aliaS,
-                                        np.hstack((getattr(self, aliaS),
-                                        data.variables[key].data[:,ID[0]:(ID[-1]+1)])))
-                                    keyCount +=1
-                            except KeyError:
-                                if debug: print key, " is missing !"
-                                continue
-                    if keyCount==0:
-                        print "---Horizontal variables are missing---"
-                    self._3D = False 
-                    
-                    #loading verti data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl3D, al3D):
-                        try:
-                            H = 0 #local counter
-                            for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                                ID = map(itemgetter(1), g)
-                                if debug: print 'Index bound: ' +\
-                                          str(ID[0]) + '-' + str(ID[-1]+1)
-                                if H==0:
-                                    setattr(self, aliaS,
-                                    data.variables[key].data[:,:,ID[0]:(ID[-1]+1)])
-                                    H=1
-                                else:
-                                    setattr(self, aliaS,
-                                    np.dstack((getattr(self, aliaS),
-                                    data.variables[key].data[:,:,ID[0]:(ID[-1]+1)])))
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Vertical variables are missing---"
-                    else:
-                        self._3D = True
+    def _loader(self, data, grid, key, region_t):
+        '''Return the function loading key on first access'''
+        loader = lambda: self._read(data, grid, key, region_t)
+        #Gives access to the reads, so that they can be shared between
+        #several variables (see LazyAttributes._load_all)
+        loader.plan = lambda: self._plan(data, grid, key, region_t)
+        return loader
 
-                #Not OpenDap
-                else:
-                    #loading hori data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl2D, al2D):
-                        try:
-                            if key=='zeta':
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nnode)))
-                                for i in range(grid.ntime):
-                                    #TR comment: looping on time indices is a trick from
-                                    #            Mitchell to improve loading time
-                                    #TR comment: no idea why I have to transpose here but
-                                    #            I do !!
-                                    getattr(self, aliaS)[i,:] =\
-                                    np.transpose(data.variables[key].data[i,region_n])
-                            else:
-                                setattr(self, aliaS, np.zeros((grid.ntime, grid.nele)))
-                                for i in range(grid.ntime):
-                                    #TR comment: looping on time indices is a trick from
-                                    #            Mitchell to improve loading time
-                                    #TR comment: no idea why I have to transpose here but
-                                    #            I do !!
-                                    getattr(self, aliaS)[i,:] =\
-                                    np.transpose(data.variables[key].data[i,region_e])
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Horizontal variables are missing---"
-                    self._3D = False 
-                    
-                    #loading verti data
-                    keyCount = 0
-                    for key, aliaS in zip(kwl3D, al3D):
-                        try:
-                            testKey = data.variables[key]
-                            del testKey
-                            setattr(self, aliaS,
-                            np.zeros((grid.ntime,grid.nlevel, grid.nele)))
-                            for i in range(grid.ntime):
-                                #TR comment: looping on time indices is a trick from
-                                #            Mitchell to improve loading time
-                                #TR comment: no idea why I have to transpose here but
-                                #            I do !!
-                                getattr(self, aliaS)[i,:,:] =\
-                                np.transpose(data.variables[key].data[i,:,region_e])
-                            keyCount +=1
-                        except KeyError:
-                            if debug: print key, " is missing !"
-                            continue
-                    if keyCount==0:
-                        print "---Vertical variables are missing---"
-                    else:
-                        self._3D = True 
+    def _read(self, data, grid, key, region_t, debug=False):
+        '''Read key within time period and bounding box'''
+        out, tasks = self._plan(data, grid, key, region_t, debug=debug)
+        run_tasks(tasks, workers=self._workers)
+        return out
+
+    def _plan(self, data, grid, key, region_t, debug=False):
+        '''Plan the reads of key within time period and bounding box'''
+        debug = debug or self._debug
         if debug:
-            print '...Passed'
+            print 'Loading ' + key + '...'
+        var = data.variables[key]
+        #zeta is defined at nodes, all the others at elements
+        if key=='zeta':
+            region = getattr(grid, '_node_index', [])
+        else:
+            region = getattr(grid, '_element_index', [])
+        if len(region_t)==0:
+            ts, te = 0, grid.ntime
+        else:
+            ts, te = region_t[0], region_t[-1] + 1
+
+        #No time period and no bounding box: simple link to the file,
+        #but not to several files
+        source = getattr(var.data, 'dtype', None)
+        if len(region_t)==0 and grid._ax==[] and \
+           not isinstance(var.data, MultiVariable) and \
+           (self._dtype is None or source is None or source==self._dtype):
+            return var.data, []
+        dtype = self._dtype
+        if dtype is None:
+            dtype = float
+
+        #Bulk reads of contiguous time blocks
+        #TR comment: OpenDap proxies don't work with non consecutive
+        #            indices, read_utils coalesces them into few block reads
+        if grid._ax==[]:
+            size = var.shape[-1]
+            region = slice(None)
+        else:
+            size = len(region)
+        out = allocate((te - ts,) + tuple(var.shape[1:-1]) + (size,),
+                       dtype=dtype, max_memory=self._max_memory)
+        return plan_time_blocks(var, ts, te, region=region, out=out,
+                                debug=debug)
 
     def _t_region(self, tx, debug=False):
         '''Return time indices included in time period, aka tx'''
         debug = debug or self._debug      
         if debug:
             print 'Computing region_t...'
-        region_t = time_to_index(tx[0], tx[1],
-                   (self.julianTime[:] + 678942.0), debug=debug)       
+        region_t = TimeAxis(self.julianTime[:] + 678942.0).index(tx[0], tx[1],
+                                                                debug=debug)
         if debug:
             print '...Passed'
         # Add metadata entry
@@ -497,7 +219,7 @@ Some others shall be generated as methods are being called, ex:
 
         return region_t
 
-class _load_grid:
+class _load_grid(LazyAttributes):
     '''
 'Grid' subset in FVCOM class contains grid related quantities:
 -------------------------------------------------------------
@@ -549,17 +271,16 @@ Some others shall be generated as methods are being called, ex:
         self.awy = data.variables['awy'].data
         self.trinodes = np.transpose(data.variables['nv'].data) - 1
         self.triele = np.transpose(data.variables['nbe'].data)
-        if ax==[]:
+        if len(ax)==0:
             #Define bounding box
             self._ax = []
             #Append message to History field
             text = 'Full spatial domain'
             self._History.append(text)
-            #Define the rest of the grid variables
-            self.h = data.variables['h'][:]
-            self.siglay = data.variables['siglay'][:]
-            self.siglev = data.variables['siglev'][:]
-            self.nlevel = self.siglay.shape[0]
+            #Define the rest of the grid variables, read on first access
+            for key in ['h', 'siglay', 'siglev']:
+                self._register(key, self._loader(data, key, slice(None)))
+            self.nlevel = data.variables['siglay'].shape[0]
             try:
                 self.nele = data.dimensions['nele']
                 self.nnode = data.dimensions['node']
@@ -569,17 +290,11 @@ Some others shall be generated as methods are being called, ex:
                 self.nnode = data.lon.shape[0]
         else:
             #Checking for pre-defined regions
-            if ax=='GP':
-                ax=[-66.36, -66.31, 44.24, 44.3]
-            elif ax=='PP':
-                ax=[-66.23, -66.19, 44.37, 44.41]
-            elif ax=='DG':
-                ax=[-65.84, -65.73, 44.64, 44.72]
-            #elif ax=='MP':
-            #    ax=[
+            if type(ax)==str and ax in REGIONS:
+                ax = REGIONS[ax]
            
             print 'Re-indexing may take some time...'   
-            Data = regioner(self, ax, debug=debug)
+            Data = cached_regioner(self, ax, debug=debug)
             self.lon = Data['lon'][:]
             self.lat = Data['lat'][:]
             self.lonc = Data['lonc'][:]
@@ -600,44 +315,49 @@ Some others shall be generated as methods are being called, ex:
             self._node_index = Data['node_index']
             self._element_index = Data['element_index']
 
-            #different loading technique if using OpenDap server
-            if type(data.variables).__name__=='DatasetType':
-                #Split into consecutive integers to optimise loading
-                #TR comment: data.variables['ww'].data[:,:,region_n] doesn't
-                #            work with non consecutive indices
-                H=0
-                for k, g in groupby(enumerate(self._node_index), lambda (i,x):i-x):
-                    ID = map(itemgetter(1), g)
-                    if debug: print 'Index bound: ' +\
-                        str(ID[0]) + '-' + str(ID[-1]+1)
-                    if H==0:
-                        self.h = data.variables['h'].data[ID[0]:(ID[-1]+1)]
-                        self.siglay = data.variables['siglay'].data[:,ID[0]:(ID[-1]+1)]
-                        self.siglev = data.variables['siglev'].data[:,ID[0]:(ID[-1]+1)]
-                    else:
-                        self.h = np.hstack((self.h,
-                        data.variables['h'].data[ID[0]:(ID[-1]+1)]))
-                        self.siglay = np.hstack((self.siglay,
-                        data.variables['siglay'].data[:,ID[0]:(ID[-1]+1)]))
-                        self.siglev = np.hstack((self.siglev,
-                        data.variables['siglev'].data[:,ID[0]:(ID[-1]+1)]))
-                    H=1
-            else:
-                self.h = data.variables['h'].data[self._node_index]
-                self.siglay = data.variables['siglay'].data[:,self._node_index]
-                self.siglev = data.variables['siglev'].data[:,self._node_index]
+            #Only read on first access
+            for key in ['h', 'siglay', 'siglev']:
+                self._register(key, self._loader(data, key, self._node_index))
             #Dimensions
-            self.nlevel = self.siglay.shape[0]
+            self.nlevel = data.variables['siglay'].shape[0]
             self.nele = Data['element_index'].shape[0]
             self.nnode = Data['node_index'].shape[0]
 
             del Data
-            #Define bounding box
-            self._ax = ax
-            # Add metadata entry
-            text = 'Bounding box =' + str(ax)
+            if is_box(ax):
+                #Define bounding box
+                self._ax = ax
+                # Add metadata entry
+                text = 'Bounding box =' + str(ax)
+            else:
+                #Bounding box of the region, the region itself is kept
+                self._ax = [self.lon.min(), self.lon.max(),
+                            self.lat.min(), self.lat.max()]
+                self._region = ax
+                # Add metadata entry
+                if is_mask(ax):
+                    text = 'Element mask, ' + str(self.nele) + ' elements'
+                else:
+                    text = 'Region =' + str([(kind, np.asarray(shape).tolist())
+                                  for kind, shape in split_regions(ax)])
             self._History.append(text)
             print '-Now working in bounding box-'
     
         if debug:
             print '...Passed'
+
+    def _loader(self, data, key, region):
+        '''Return the function loading key on first access'''
+        return lambda: self._read(data, key, region)
+
+    def _read(self, data, key, region, debug=False):
+        '''Read node variable key within bounding box'''
+        debug = debug or self._debug
+        if debug:
+            print 'Loading ' + key + '...'
+        var = data.variables[key]
+        if type(region)==slice:
+            return var[(slice(None),) * (len(var.shape) - 1) + (region,)]
+        #TR comment: OpenDap proxies don't work with non consecutive
+        #            indices, read_utils coalesces them into few block reads
+        return read_columns(var.data, region, dtype=None, debug=debug)
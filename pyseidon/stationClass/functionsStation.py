@@ -9,6 +9,8 @@ import numexpr as ne
 from datetime import datetime
 from datetime import timedelta
 from miscellaneous import *
+from time_axis import time_axis
+from exceedance import exceedance_curves
 from BP_tools import *
 import time
 
@@ -86,9 +88,9 @@ class FunctionsStation:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
 
         #Search for the station
         index = self.search_index(station)
@@ -161,11 +163,9 @@ class FunctionsStation:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end,
-                                        self._var.matlabTime,
-                                        debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
 
         #Search for the station
         index = self.search_index(station)
@@ -256,6 +256,8 @@ class FunctionsStation:
         Notes:
         -----
           - This method is not suitable for SSE
+          - Exceedance is the % of time steps above each bin, see
+            exceedance.exceedance_curves
         """
         debug = (debug or self._debug)
         if debug:
@@ -275,23 +277,7 @@ class FunctionsStation:
         Max = max(signal)	
         dy = (Max/30.0)
         Ranges = np.arange(0,(Max + dy), dy)
-        Exceedance = np.zeros(Ranges.shape[0])
-        dt = self._var.julianTime[1] - self._var.julianTime[0]
-        if dt==0:
-            dt = self._var.secondTime[1] - self._var.secondTime[0]
-        Period = var.shape[0] * dt
-        time = np.arange(0.0, Period, dt)
-
-        N = len(signal)
-        M = len(Ranges)
-
-        for i in range(M):
-            r = Ranges[i]
-            for j in range(N-1):
-                if signal[j] > r:
-                    Exceedance[i] = Exceedance[i] + (time[j+1] - time[j])
-
-        Exceedance = (Exceedance * 100) / Period
+        Exceedance, Ranges = exceedance_curves(signal, bins=Ranges)
 
         if debug:
             print '...Passed'
@@ -391,11 +377,9 @@ class FunctionsStation:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end,
-                                        self._var.matlabTime,
-                                        debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
         
         if velocity:
             time = self._var.matlabTime[:]
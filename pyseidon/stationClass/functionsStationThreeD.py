@@ -8,6 +8,7 @@ import numexpr as ne
 from datetime import datetime
 from datetime import timedelta
 from miscellaneous import *
+from time_axis import time_axis
 from BP_tools import *
 import time
 
@@ -126,7 +127,7 @@ class FunctionsStationThreeD:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
                 argtime = np.arange(t_start, t_end) 
 
@@ -212,9 +213,9 @@ class FunctionsStationThreeD:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
 
         #Search for the station
         index = self.search_index(station)
@@ -295,9 +296,9 @@ class FunctionsStationThreeD:
             argtime = time_ind
         elif not t_start==[]:
             if type(t_start)==str:
-                argtime = time_to_index(t_start, t_end, self._var.matlabTime, debug=debug)
+                argtime = time_axis(self._var).index(t_start, t_end, debug=debug)
             else:
-                argtime = arange(t_start, t_end)
+                argtime = np.arange(t_start, t_end)
         
         #Choose the right pair of velocity components
         if not argtime==[]:
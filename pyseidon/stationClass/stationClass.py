@@ -10,7 +10,7 @@ from utide import ut_solv, ut_reconstr
 from scipy.io import netcdf
 from scipy.io import savemat
 from scipy.io import loadmat
-from pydap.client import open_url
+from opendap_utils import open_url, stats, transfer_summary
 import cPickle as pkl
 import copy
 # Need to add closest point
@@ -21,7 +21,8 @@ sys.path.append('../utilities/')
 #Utility import
 from shortest_element_path import shortest_element_path
 from object_from_dict import ObjectFromDict
-from miscellaneous import findFiles, _load_nc
+from miscellaneous import _load_nc
+from catalogue import catalogue_files
 
 #Local import
 from variablesStation import _load_var, _load_grid
@@ -52,13 +53,25 @@ Inputs:
                    testFvcom=Station('./path_to_FVOM_output_file/folder/')
 
     Note that if the path point to a folder all the similar netCDF station files
-    will be stack together.
+    will be stack together. Only the files overlapping tx are opened, see
+    catalogue.
     Note that the file can be a pickle file (i.e. *.p) or a netcdf file 
     (i.e. *.nc).           
 
 Options:
 -------
   - elements = indices to extract, list of integers
+  - tx = defines for a specific temporal period to work with, as such:
+             tx = ['2012-11-07T12:00:00','2012.11.09T12:00:00'],
+         string of 'yyyy-mm-ddThh:mm:ss'.
+  - variables = variables to load, list of strings,
+                ex: variables = ['el', 'ua', 'va'].
+                All the available ones by default.
+  - exclude = variables not to load, list of strings, ex: exclude = ['w']
+  - dtype = storage type of the loaded fields, ex: dtype = np.float32.
+            float64 by default
+  - workers = number of concurrent reads, integer.
+              Note that this option mostly speeds up OpenDap access.
    
 
 Notes:
@@ -70,9 +83,15 @@ Notes:
                  +/-180=West, -90=South
   - Depth = 0m is the free surface and depth is negative
     '''
-    def __init__(self, filename, elements=slice(None), debug=False):
+    def __init__(self, filename, elements=slice(None), tx=[], variables=[],
+                 exclude=[], dtype=None, workers=1, debug=False):
         #Class attributs
         self._debug = debug
+        self._tx = tx
+        self._dtype = dtype
+        self._variables = variables
+        self._exclude = exclude
+        self._workers = workers
         self._isMulti(filename)
         if not self._multi:
             self._load(filename, elements)
@@ -93,7 +112,11 @@ Notes:
                                        self._debug) 
         else:
             print "---Finding matching files---"
-            self._matches = findFiles(filename, 'STATION')
+            self._matches = catalogue_files(filename, tx=tx, kind='station',
+                                            recursive=True, debug=debug)
+            if self._matches==[]:
+                print "---No station file found---"
+                sys.exit()
             filename = self._matches.pop(0)
             self._load(filename, elements, debug=debug )
             self.Plots = PlotsStation(self.Variables,
@@ -119,6 +142,11 @@ Notes:
                 tmp['History'] = [text]
                 tmp['Grid'] = _load_grid(tmp['Data'], elements, [], debug=self._debug)
                 tmp['Variables'] = _load_var(tmp['Data'], elements, tmp['Grid'], [],
+                                             tx=tx,
+                                             variables=variables,
+                                             exclude=exclude,
+                                             dtype=dtype,
+                                             workers=workers,
                                              debug=self._debug)
                 tmp = ObjectFromDict(tmp)
                 self = self.__add__(tmp)
@@ -161,6 +189,7 @@ Notes:
 
         #Loading netcdf file         
         elif filename.endswith('.nc'):
+            transfer = stats()
             if filename.startswith('http'):
                 #Look for file through OpenDAP server
                 print "Retrieving data through OpenDap server..."
@@ -190,7 +219,16 @@ Notes:
                                            elements,
                                            self.Grid,
                                            self.History,
+                                           tx=self._tx,
+                                           variables=self._variables,
+                                           exclude=self._exclude,
+                                           dtype=self._dtype,
+                                           workers=self._workers,
                                            debug=self._debug)
+                #Cached answers are reported, they may be outdated
+                if filename.startswith('http') and \
+                   (self._debug or stats()['hits'] > transfer['hits']):
+                    print "OpenDap transfer: " + transfer_summary(transfer)
 
             except MemoryError:
                 print '---Data too large for machine memory---'
@@ -3,11 +3,11 @@
 
 from __future__ import division
 import numpy as np
-from itertools import groupby
-from operator import itemgetter
 #Local import
-from miscellaneous import time_to_index
+from time_axis import TimeAxis
 from miscellaneous import mattime_to_datetime
+from miscellaneous import select_variables
+from read_utils import plan_time_blocks, run_tasks
 
 class _load_grid:
     '''
@@ -92,153 +92,103 @@ Some others shall be generated as methods are being called, ex:
                     |_verti_shear = vertical shear (1/s),
                                   3D array (ntime, nlevel, nele)           
     """
-    def __init__(self, data, elements, grid, History, debug=False):
+    def __init__(self, data, elements, grid, History, tx=[], variables=[],
+                 exclude=[], dtype=None, workers=1, debug=False):
         if debug: print 'Loading variables...'
 
         #Pointer to History
         self._History = History
         History = self._History
+        #Storage type of the loaded fields
+        self._dtype = None
+        if not dtype is None:
+            self._dtype = np.dtype(dtype)
+        else:
+            dtype = float
 
         #List of keywords
         kwl2D = ['ua', 'va', 'zeta']
         kwl3D = ['ww', 'u', 'v', 'gls', 'tke']
         #List of aliaSes
         al2D = ['ua', 'va', 'el']
-        al3D = ['u', 'u', 'v', 'gls', 'tke']         
+        al3D = ['w', 'u', 'v', 'gls', 'tke']
+
+        #Restrict to the requested variables
+        if not (variables==[] and exclude==[]):
+            unknown = [v for v in variables + exclude if not v in al2D + al3D]
+            if not unknown==[]:
+                print "---Unknown variables: " + str(unknown) + "---"
+            kwl2D, al2D = select_variables(kwl2D, al2D, variables, exclude)
+            kwl3D, al3D = select_variables(kwl3D, al3D, variables, exclude)
+            text = 'Variables = ' + str(al2D + al3D)
+            self._History.append(text)
 
         if debug: print '...time variables...'
         self.julianTime = data.variables['time_JD'][:]
         self.secondTime = data.variables['time_second'][:]
         self.matlabTime = self.julianTime[:] + 678942.0 + self.secondTime[:] / (24*3600)
+        ts, te = 0, self.matlabTime.shape[0]
+        if not tx==[]:
+            #Time period
+            ts, te = TimeAxis(self.matlabTime).bounds(tx[0], tx[1])
+            self.julianTime = self.julianTime[ts:te]
+            self.secondTime = self.secondTime[ts:te]
+            self.matlabTime = self.matlabTime[ts:te]
+            text = 'Time period =' + str(tx)
+            self._History.append(text)
         grid.ntime = self.matlabTime.shape[0]
+        #Time index, see time_axis
+        self._time = TimeAxis(self.matlabTime)
 
         if debug: print '...hydro variables...'
 
         region_e = elements
         region_n = elements
-        #Redefine variables in bounding box
-        #Check if OpenDap variables or not
-        if type(data.variables).__name__=='DatasetType':
-            #loading hori data
-            keyCount = 0
-            for key, aliaS in zip(kwl2D, al2D):
-                #Special loading for zeta
-                H = 0 #local counter
-                if key == 'zeta':
-                    for k, g in groupby(enumerate(region_n), lambda (i,x):i-x):
-                        ID = map(itemgetter(1), g)
-                        if debug: print 'Index bound: ' +\
-                            str(ID[0]) + '-' + str(ID[-1]+1)
-                        if H==0:
-                            setattr(self, aliaS,
-                            data.variables[key].data[:,ID[0]:(ID[-1]+1)])
-                            H=1
-                        else:
-                            setattr(self, aliaS,                            
-                            np.hstack((getattr(self, aliaS),
-                            data.variables[key].data[:,ID[0]:(ID[-1]+1)])))
+        #Bulk reads of contiguous time blocks
+        #TR comment: OpenDap proxies don't work with non consecutive
+        #            indices, read_utils coalesces them into few block reads
+        #            which are run together on a pool of 'workers' threads
+        tasks = []
+        #loading hori data
+        keyCount = 0
+        for key, aliaS in zip(kwl2D, al2D):
+            try:
+                if key=='zeta':
+                    region = region_n
                 else:
-                    try:                        
-                        for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                            ID = map(itemgetter(1), g)
-                            if debug: print 'Index bound: ' +\
-                                      str(ID[0]) + '-' + str(ID[-1]+1)
-                            if H==0:
-                                setattr(self, aliaS,
-                                        data.variables[key].\
-                                        data[:,ID[0]:(ID[-1]+1)])
-                                H=1
-                            else:
-                                setattr(self, aliaS,
-                                np.hstack((getattr(self, aliaS),
-                                data.variables[key].data[:,ID[0]:(ID[-1]+1)])))
-                            keyCount +=1
-                    except KeyError:
-                        if debug: print key, " is missing !"
-                        continue
-            if keyCount==0:
-                print "---Horizontal variables are missing---"
-            self._3D = False 
-                    
-            #loading verti data
-            keyCount = 0
-            for key, aliaS in zip(kwl3D, al3D):
-                try:
-                    H = 0 #local counter
-                    for k, g in groupby(enumerate(region_e), lambda (i,x):i-x):
-                        ID = map(itemgetter(1), g)
-                        if debug: print 'Index bound: ' +\
-                                  str(ID[0]) + '-' + str(ID[-1]+1)
-                        if H==0:
-                            setattr(self, aliaS,
-                            data.variables[key].data[:,:,ID[0]:(ID[-1]+1)])
-                            H=1
-                        else:
-                            setattr(self, aliaS,
-                            np.dstack((getattr(self, aliaS),
-                            data.variables[key].data[:,:,ID[0]:(ID[-1]+1)])))
-                    keyCount +=1
-                except KeyError:
-                    if debug: print key, " is missing !"
-                    continue
-            if keyCount==0:
+                    region = region_e
+                out, reads = plan_time_blocks(data.variables[key], ts, te,
+                                              region=region,
+                                              dtype=dtype, debug=debug)
+                setattr(self, aliaS, out)
+                tasks.extend(reads)
+                keyCount +=1
+            except KeyError:
+                if debug: print key, " is missing !"
+                continue
+        if keyCount==0 and not kwl2D==[]:
+            print "---Horizontal variables are missing---"
+        self._3D = False 
+        
+        #loading verti data
+        keyCount = 0
+        for key, aliaS in zip(kwl3D, al3D):
+            try:
+                out, reads = plan_time_blocks(data.variables[key], ts, te,
+                                              region=region_e,
+                                              dtype=dtype, debug=debug)
+                setattr(self, aliaS, out)
+                tasks.extend(reads)
+                keyCount +=1
+            except KeyError:
+                if debug: print key, " is missing !"
+                continue
+        if keyCount==0:
+            if not kwl3D==[]:
                 print "---Vertical variables are missing---"
-            else:
-                self._3D = True
-        #Not OpenDap
         else:
-            #loading hori data
-            keyCount = 0
-            for key, aliaS in zip(kwl2D, al2D):
-                try:
-                    if key=='zeta':
-                        setattr(self, aliaS, np.zeros((grid.ntime, grid.nnode)))
-                        for i in range(grid.ntime):
-                            #TR comment: looping on time indices is a trick from
-                            #            Mitchell to improve loading time
-                            #TR comment: no idea why I have to transpose here but
-                            #            I do !!
-                            getattr(self, aliaS)[i,:] =\
-                            np.transpose(data.variables[key].data[i,region_n])
-                    else:
-                        setattr(self, aliaS, np.zeros((grid.ntime, grid.nele)))
-                        for i in range(grid.ntime):
-                            #TR comment: looping on time indices is a trick from
-                            #            Mitchell to improve loading time
-                            #TR comment: no idea why I have to transpose here but
-                            #            I do !!
-                            getattr(self, aliaS)[i,:] =\
-                            np.transpose(data.variables[key].data[i,region_e])
-                    keyCount +=1
-                except KeyError:
-                    if debug: print key, " is missing !"
-                    continue
-            if keyCount==0:
-                print "---Horizontal variables are missing---"
-            self._3D = False 
-            
-            #loading verti data
-            keyCount = 0
-            for key, aliaS in zip(kwl3D, al3D):
-                try:
-                    testKey = data.variables[key]
-                    del testKey
-                    setattr(self, aliaS,
-                    np.zeros((grid.ntime,grid.nlevel, grid.nele)))
-                    for i in range(grid.ntime):
-                        #TR comment: looping on time indices is a trick from
-                        #            Mitchell to improve loading time
-                        #TR comment: no idea why I have to transpose here but
-                        #            I do !!
-                        getattr(self, aliaS)[i,:,:] =data.variables[key].data[i,:,region_e]
-                    keyCount +=1
-                except KeyError:
-                    if debug: print key, " is missing !"
-                    continue
-            if keyCount==0:
-                print "---Vertical variables are missing---"
-            else:
-                self._3D = True 
+            self._3D = True 
+        run_tasks(tasks, workers=workers)
         if debug:
            print '...Passed'
 
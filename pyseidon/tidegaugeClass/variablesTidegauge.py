@@ -3,6 +3,7 @@
 
 from __future__ import division
 import numpy as np
+from time_axis import TimeAxis
 
 class _load_tidegauge:
     """
@@ -20,6 +21,8 @@ class _load_tidegauge:
         self.RBR = cls['RBR']
         data = self.RBR.data
         self.matlabTime = self.RBR.date_num_Z
+        #Time index, see time_axis
+        self._time = TimeAxis(self.matlabTime)
         self.lat = self.RBR.lat
         self.lon = self.RBR.lon
         self.el = data - np.mean(data)
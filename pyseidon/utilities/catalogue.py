@@ -0,0 +1,246 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import os
+import fnmatch
+import glob
+import numpy as np
+from scipy.io import netcdf
+from disk_cache import DiskCache, CACHE_ROOT, _digest
+from time_axis import datetime64_to_datenum
+
+#Catalogues of all the folders, one small entry per folder
+_cache = DiskCache(os.path.join(CACHE_ROOT, 'catalogue'))
+
+def _describe(path):
+    """Time coverage, dimensions and grid fingerprint of an output file"""
+    data = netcdf.netcdf_file(path, 'r', mmap=True)
+    var = data.variables
+    try:
+        if 'time_JD' in var:
+            #Station file
+            kind = 'station'
+            time = var['time_JD'][:] + 678942.0 + \
+                   var['time_second'][:] / (24*3600)
+            grid = _digest(var['x'][:].tostring() + var['y'][:].tostring())
+        else:
+            kind = 'fvcom'
+            time = var['time'][:] + 678942.0
+            grid = _digest(var['nv'][:].tostring() + var['lon'][:].tostring())
+        #Copy, the file is closed below
+        time = np.array(time, dtype=np.float64)
+        dims = dict(data.dimensions)
+        dims['time'] = time.shape[0]
+    finally:
+        #Drops the references to the mapped file before closing it
+        del var
+        data.variables.clear()
+        data.close()
+    if time.shape[0]==0:
+        start = end = step = None
+    else:
+        start, end = float(time[0]), float(time[-1])
+        step = None
+        if time.shape[0] > 1:
+            step = float(np.median(np.diff(time)))
+    return {'kind': kind, 'start': start, 'end': end, 'step': step,
+            'ntime': time.shape[0], 'dims': dims, 'grid': grid}
+
+def _match(path, pattern):
+    """fnmatch of path against pattern, one folder level at a time"""
+    if not os.sep in pattern:
+        return fnmatch.fnmatch(os.path.basename(path), pattern)
+    parts = path.split(os.sep)
+    patterns = pattern.split(os.sep)
+    if not len(parts)==len(patterns):
+        return False
+    return all(fnmatch.fnmatch(p, q) for p, q in zip(parts, patterns))
+
+class Catalogue(object):
+    """
+    Description:
+    -----------
+    Persistent catalogue of the FVCOM and Station output files of a folder.
+
+    Each file is described once by its time coverage (matlab datenums),
+    time step, dimensions and a fingerprint of its grid. The descriptions
+    are kept in a small index on disk and only new or modified files are
+    opened again, so that picking a period out of a large output tree does
+    not require opening every file.
+
+    Inputs:
+    ------
+      - directory = path to folder, string
+
+    Keywords:
+    --------
+      - cache = index storage, DiskCache. The default one is shared by
+                every folder
+      - pattern = files to catalogue, see update
+      - recursive = True to include the sub-folders, see update
+
+    Notes:
+    -----
+      - ex: Catalogue('./run/').files(tx=['2012-11-07T12:00:00',
+                                          '2012-11-09T12:00:00'])
+    """
+    def __init__(self, directory, cache=None, pattern='*.nc', recursive=True,
+                 debug=False):
+        self.directory = os.path.realpath(directory)
+        self._store = cache
+        if cache is None:
+            self._store = _cache
+        try:
+            self.entries = self._store.get(self.directory)
+        except KeyError:
+            self.entries = {}
+        self.update(pattern=pattern, recursive=recursive, debug=debug)
+
+    def _scope(self, pattern, recursive):
+        """Pattern matching the files in scope, see _match"""
+        if not recursive and not os.sep in pattern:
+            return os.path.join(self.directory, pattern)
+        return pattern
+
+    def _scan(self, pattern):
+        """Paths of the *.nc files matching a scope pattern"""
+        if os.sep in pattern:
+            paths = glob.glob(pattern)
+        else:
+            paths = []
+            for root, dirnames, filenames in os.walk(self.directory):
+                for name in fnmatch.filter(filenames, pattern):
+                    paths.append(os.path.join(root, name))
+        return [path for path in paths
+                if path.endswith('.nc') and os.path.isfile(path)]
+
+    def update(self, pattern='*.nc', recursive=True, debug=False):
+        """
+        Describe the new and modified files, forget the removed ones.
+
+        Keywords:
+        --------
+          - pattern = file name pattern, string, ex: '*station*.nc', or
+                      path pattern, ex: '/run/*/out_*.nc', matched level
+                      by level as glob does
+          - recursive = True to look for file name patterns in the
+                        sub-folders too
+
+        Notes:
+        -----
+          - only the files matching pattern are listed and opened, the
+            entries of the other files are kept as they are
+        """
+        pattern = self._scope(pattern, recursive)
+        found = {}
+        for path in self._scan(pattern):
+            stat = os.stat(path)
+            found[path] = (stat.st_mtime, stat.st_size)
+        entries = dict([(path, entry) for path, entry in self.entries.items()
+                        if not _match(path, pattern)])
+        changed = not len(entries) + len(found)==len(self.entries)
+        for path, signature in found.items():
+            entry = self.entries.get(path)
+            if entry is None or not entry['signature']==signature:
+                if debug: print "Cataloguing " + path + "..."
+                try:
+                    entry = _describe(path)
+                except (IOError, OSError, KeyError, TypeError, ValueError):
+                    if debug: print path + " is not an output file"
+                    entry = {'kind': None}
+                entry['signature'] = signature
+                changed = True
+            entries[path] = entry
+        self.entries = entries
+        if changed:
+            self._store.put(self.directory, self.entries)
+
+    def files(self, pattern='*.nc', tx=[], kind=None, grid=None):
+        """
+        Output files matching a pattern and overlapping a time period.
+
+        Keywords:
+        --------
+          - pattern = file name pattern, string, ex: '*station*.nc',
+                      matched in every sub-folder. A path pattern,
+                      ex: '/run/*/out_*.nc', is matched level by level
+          - tx = time period, ['yyyy-mm-ddThh:mm:ss', 'yyyy-mm-ddThh:mm:ss']
+          - kind = 'fvcom' or 'station'. Both by default
+          - grid = grid fingerprint, string. All grids by default
+
+        Outputs:
+        -------
+          - files = paths to files, list of strings sorted by start time
+        """
+        if not tx==[]:
+            t0, t1 = datetime64_to_datenum(np.array(tx[:2],
+                                           dtype='datetime64[us]'))
+        matches = []
+        for path, entry in self.entries.items():
+            if entry['kind'] is None or entry['start'] is None:
+                continue
+            if not _match(path, pattern):
+                continue
+            if not (kind is None or entry['kind']==kind):
+                continue
+            if not (grid is None or entry['grid']==grid):
+                continue
+            if not tx==[] and (entry['end'] < t0 or entry['start'] > t1):
+                continue
+            matches.append((entry['start'], path))
+
+        return [path for start, path in sorted(matches)]
+
+    def grids(self, files):
+        """Grid fingerprints of files, list of strings"""
+        return [self.entries[os.path.realpath(f)]['grid'] for f in files]
+
+def catalogue_files(filename, tx=[], kind=None, recursive=False, debug=False):
+    """
+    Output files of a folder or glob pattern overlapping a time period.
+
+    Inputs:
+    ------
+      - filename = path to folder or glob pattern, string,
+                   ex: './run/' or './run/dngrid_00*.nc'
+
+    Outputs:
+    -------
+      - files = paths to files, list of strings sorted by start time
+
+    Keywords:
+    --------
+      - tx = time period, ['yyyy-mm-ddThh:mm:ss', 'yyyy-mm-ddThh:mm:ss']
+      - kind = 'fvcom' or 'station'. Both by default
+      - recursive = True to include the sub-folders of a folder
+
+    Notes:
+    -----
+      - glob patterns match as glob.glob does, i.e. sub-folders only
+        through the folder part of the pattern, ex: './run/*/out_*.nc'
+      - only the files on the grid of the first match are kept
+    """
+    if os.path.isdir(filename):
+        directory, pattern = filename, '*.nc'
+        if not recursive:
+            pattern = os.path.join(os.path.realpath(filename), '*.nc')
+    else:
+        #Catalogued from the deepest folder without wildcard
+        parts = filename.split(os.sep)
+        n = 0
+        while n < len(parts) - 1 and not glob.has_magic(parts[n]):
+            n += 1
+        directory = os.sep.join(parts[:n]) or (os.sep if n else '.')
+        pattern = os.path.join(os.path.realpath(directory), *parts[n:])
+    cat = Catalogue(directory, pattern=pattern, recursive=recursive,
+                    debug=debug)
+    files = cat.files(pattern=pattern, tx=tx, kind=kind)
+    if files==[]:
+        return files
+    grids = cat.grids(files)
+    kept = [f for f, g in zip(files, grids) if g==grids[0]]
+    if not len(kept)==len(files):
+        print "---" + str(len(files) - len(kept)) + \
+              " files on a different grid are skipped---"
+    return kept
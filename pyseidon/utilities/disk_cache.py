@@ -0,0 +1,176 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import os
+import shutil
+import hashlib
+import threading
+import cPickle as pkl
+
+#Default location and size cap (bytes) of the caches
+CACHE_ROOT = os.path.join(os.path.expanduser('~'), '.pyseidon', 'cache')
+CACHE_SIZE = 2 * 1024**3
+
+def _digest(text):
+    """Hexadecimal sha1 digest of text"""
+    return hashlib.sha1(text).hexdigest()
+
+class DiskCache(object):
+    """
+    Description:
+    -----------
+    Persistent content-addressed cache of picklable objects.
+
+    Each entry is stored in its own file named after the sha1 digest of its
+    key, in a sub-folder named after the digest of its namespace, so that a
+    whole namespace can be dropped at once. Reading an entry refreshes its
+    modification time and the least recently used entries are evicted when
+    the total size exceeds the cap.
+
+    Inputs:
+    ------
+      - directory = path to the cache folder, string
+
+    Keywords:
+    --------
+      - size = size cap in bytes, integer
+
+    Notes:
+    -----
+      - entries are written to a temporary file and then renamed, so that
+        concurrent readers never see a partial entry
+      - the cache is best effort: unwritable folders or corrupted entries
+        are silently ignored
+    """
+    def __init__(self, directory, size=CACHE_SIZE):
+        self.directory = directory
+        self.size = size
+        self._used = None
+        self._lock = threading.Lock()
+
+    def _path(self, key, namespace=''):
+        """Path to the entry of key"""
+        return os.path.join(self.directory, _digest(namespace), _digest(key))
+
+    def get(self, key, namespace=''):
+        """
+        Return the value stored under key.
+
+        Inputs:
+        ------
+          - key = string
+
+        Keywords:
+        --------
+          - namespace = group of entries, string
+
+        Notes:
+        -----
+          - raises KeyError if key is not in the cache
+        """
+        path = self._path(key, namespace)
+        try:
+            f = open(path, 'rb')
+            try:
+                storedKey, value = pkl.load(f)
+            finally:
+                f.close()
+            #Most recently used
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, ValueError, TypeError,
+                pkl.UnpicklingError):
+            raise KeyError(key)
+        #Guards against digest collisions
+        if not storedKey==key:
+            raise KeyError(key)
+
+        return value
+
+    def put(self, key, value, namespace=''):
+        """
+        Store value under key.
+
+        Inputs:
+        ------
+          - key = string
+          - value = picklable object
+
+        Keywords:
+        --------
+          - namespace = group of entries, string
+        """
+        path = self._path(key, namespace)
+        tmp = path + '.' + str(os.getpid()) + '.' + \
+              str(threading.current_thread().ident)
+        try:
+            folder = os.path.dirname(path)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            f = open(tmp, 'wb')
+            try:
+                pkl.dump((key, value), f, protocol=pkl.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            os.rename(tmp, path)
+            added = os.path.getsize(path)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            if self._used is None:
+                self._used = self.used()
+            else:
+                self._used += added
+            if self._used > self.size:
+                self._evict()
+
+    def _entries(self):
+        """List of (mtime, size, path) of all the entries"""
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def used(self):
+        """Total size of the entries in bytes"""
+        return sum([size for mtime, size, path in self._entries()])
+
+    def _evict(self):
+        """Remove the least recently used entries until below the cap"""
+        entries = sorted(self._entries())
+        used = sum([size for mtime, size, path in entries])
+        for mtime, size, path in entries:
+            if used <= self.size:
+                break
+            try:
+                os.remove(path)
+                used -= size
+            except OSError:
+                pass
+        self._used = used
+
+    def invalidate(self, namespace=None):
+        """
+        Remove entries from the cache.
+
+        Keywords:
+        --------
+          - namespace = group of entries to remove, string. All by default
+        """
+        if namespace is None:
+            folder = self.directory
+        else:
+            folder = os.path.join(self.directory, _digest(namespace))
+        shutil.rmtree(folder, ignore_errors=True)
+        with self._lock:
+            self._used = None
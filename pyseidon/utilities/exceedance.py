@@ -0,0 +1,83 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import numpy as np
+from memory_utils import time_chunks
+from read_utils import read_columns, BLOCK_BYTES
+
+#Default number of amplitude bins, as for the exceedance curves at a point
+NBINS = 31
+
+def _block(var, t, index):
+    """var over the time steps t, and the columns index if any, as float64"""
+    if len(index)==0:
+        return np.asarray(var[t], dtype=np.float64)
+    return read_columns(var, index, lead=(t,))
+
+def exceedance_curves(var, bins=NBINS, index=[], max_memory=None):
+    """
+    Exceedance curves of every column of a variable, by chunks of time steps.
+
+    Inputs:
+    ------
+      - var = given quantity, numpy array, memmap or netcdf variable,
+              dim=(time), (time, nele or node) or (time, level, nele or node)
+
+    Outputs:
+    -------
+      - exceedance = % of time steps above each amplitude bin, numpy array,
+                     dim=(nbins,)+var.shape[1:] or (nbins,...,len(index))
+      - ranges = amplitude bins, 1D array (nbins)
+
+    Keywords:
+    --------
+      - bins = number of bins from 0 to the maximum of var, integer,
+               or amplitude bins, increasing 1D array
+      - index = columns to work on, list of integers. All by default
+      - max_memory = memory budget in bytes, integer. Chunks are limited
+                     to read_utils.BLOCK_BYTES if None
+
+    Notes:
+    -----
+      - each value is placed among the bins by searchsorted, the counts
+        are then cumulated from the top bin down, i.e. no loop over bins
+      - var is read twice if bins is a number, once for its maximum
+      - nan values exceed no bin
+    """
+    shape = tuple(var.shape)
+    ntime = shape[0]
+    space = shape[1:]
+    if len(index) > 0:
+        index = np.asarray(index, dtype=int)
+        space = shape[1:-1] + (index.shape[0],)
+    ncol = int(np.prod(space))
+    budget = max_memory
+    if budget is None:
+        budget = BLOCK_BYTES
+    #TR: counted as float64 block, bin positions and their flat indices
+    chunks = time_chunks(ntime, 8 * ncol * 3, budget)
+
+    if np.ndim(bins)==0:
+        vmax = 0.0
+        for t in chunks:
+            vmax = max(vmax, np.nanmax(_block(var, t, index)))
+        ranges = np.linspace(0.0, vmax, int(bins))
+    else:
+        ranges = np.asarray(bins, dtype=np.float64)
+    nbins = ranges.shape[0]
+
+    #counts[k, j] = time steps of column j above exactly k bins
+    counts = np.zeros((nbins + 1, ncol), dtype=np.int64)
+    column = np.arange(ncol)
+    for t in chunks:
+        block = _block(var, t, index).reshape(-1, ncol)
+        k = np.searchsorted(ranges, block, side='left')
+        k[np.isnan(block)] = 0
+        counts += np.bincount((k * ncol + column).ravel(),
+                              minlength=(nbins + 1) * ncol
+                              ).reshape(nbins + 1, ncol)
+    above = np.cumsum(counts[::-1], axis=0)[::-1][1:]
+    exceedance = (above * 100.0 / ntime).reshape((nbins,) + space)
+
+    return exceedance, ranges
@@ -0,0 +1,117 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import numpy as np
+from scipy.io import netcdf
+from probe import Probe
+from time_axis import TimeAxis
+from memory_utils import allocate, time_chunks
+from miscellaneous import select_variables
+from read_utils import BLOCK_BYTES
+
+#Station file keywords and their names in FVCOM and Station classes
+KEYS = ['zeta', 'ua', 'va', 'ww', 'u', 'v', 'gls', 'tke']
+ALIASES = ['el', 'ua', 'va', 'w', 'u', 'v', 'gls', 'tke']
+#Length of the station names
+NAMELEN = 20
+
+def extract_stations(data, grid, pt_lons, pt_lats, output, names=[], tx=[],
+                     variables=[], exclude=[], block_bytes=BLOCK_BYTES,
+                     max_memory=None, debug=False):
+    """
+    Interpolate FVCOM variables at points and write them as a Station file.
+
+    Inputs:
+    ------
+      - data = netcdf file, OpenDap dataset or MultiDataset
+      - grid = full domain FVCOM Grid of data
+      - pt_lons = longitudes in decimal degrees East, list of floats
+      - pt_lats = latitudes in decimal degrees North, list of floats
+      - output = path to the station file to write, string
+
+    Keywords:
+    --------
+      - names = station names, list of strings. P0000, P0001... by default
+      - tx = time period, ['yyyy-mm-ddThh:mm:ss', 'yyyy-mm-ddThh:mm:ss']
+      - variables = variables to extract, list of strings,
+                    ex: ['el', 'ua', 'va']. All the available ones by default
+      - exclude = variables not to extract, list of strings
+      - block_bytes = size of the time blocks read in one go, in bytes
+      - max_memory = memory budget per extracted variable in bytes, integer.
+                     Larger ones are kept in temporary files until written
+
+    Notes:
+    -----
+      - only the columns of the elements containing the points and of
+        their nodes and neighbours are read, by blocks of time steps
+      - the file can be opened with the Station class
+      - points outside the mesh are written as nan, see Probe
+    """
+    if debug: print 'Setting probes...'
+    probe = Probe(grid, pt_lons, pt_lats)
+    npoint = probe.npoint
+    if names==[]:
+        names = ['P' + str(i).zfill(4) for i in range(npoint)]
+    if not len(names)==npoint:
+        raise ValueError('names and points do not match')
+
+    #Time period
+    julianTime = np.asarray(data.variables['time'][:], dtype=np.float64)
+    ts, te = 0, julianTime.shape[0]
+    if not tx==[]:
+        ts, te = TimeAxis(julianTime + 678942.0).bounds(tx[0], tx[1])
+    julianTime = julianTime[ts:te]
+    ntime = te - ts
+    keys, aliases = select_variables(KEYS, ALIASES, variables, exclude)
+
+    f = netcdf.netcdf_file(output, 'w')
+    f.title = 'Virtual stations'
+    f.createDimension('time', None)
+    f.createDimension('station', npoint)
+    f.createDimension('namelen', NAMELEN)
+    f.createDimension('siglay', grid.nlevel)
+    f.createDimension('siglev', grid.nlevel + 1)
+    #Grid
+    for key, value in [('x', probe.x), ('y', probe.y), ('lon', probe.lon),
+                       ('lat', probe.lat), ('h', probe.apply(grid.h))]:
+        f.createVariable(key, 'f', ('station',))[:] = value
+    f.createVariable('siglay', 'f', ('siglay', 'station'))[:] = \
+        probe.apply(grid.siglay)
+    f.createVariable('siglev', 'f', ('siglev', 'station'))[:] = \
+        probe.apply(grid.siglev)
+    name = f.createVariable('name_station', 'c', ('station', 'namelen'))
+    name[:] = np.array([list(str(n)[:NAMELEN].ljust(NAMELEN)) for n in names])
+    #Time, as in station files
+    day = np.floor(julianTime)
+    f.createVariable('time_JD', 'i', ('time',))[:] = day.astype(np.int32)
+    f.createVariable('time_second', 'f', ('time',))[:] = \
+        (julianTime - day) * 24 * 3600
+
+    #Variables, streamed by time blocks
+    for key, aliaS in zip(keys, aliases):
+        try:
+            var = data.variables[key]
+        except KeyError:
+            if debug: print key, " is missing !"
+            continue
+        if debug: print 'Extracting ' + aliaS + '...'
+        shape = tuple(var.shape)
+        if len(shape)==2:
+            dims = ('time', 'station')
+        elif shape[1]==grid.nlevel:
+            dims = ('time', 'siglay', 'station')
+        else:
+            dims = ('time', 'siglev', 'station')
+        out = allocate((ntime,) + shape[1:-1] + (npoint,), dtype='>f4',
+                       max_memory=max_memory)
+        #TR: up to 4 columns per point are read, i.e. element and neighbours
+        step = 8 * 4 * npoint * int(np.prod(shape[1:-1]))
+        for t in time_chunks(ntime, step, block_bytes):
+            out[t] = probe.apply(var, lead=(slice(ts + t.start, ts + t.stop),))
+        ncvar = f.createVariable(key, 'f', dims)
+        #TR: written record by record on close, so out can be a memmap
+        ncvar.__dict__['data'] = out
+
+    if debug: print 'Writing ' + output + '...'
+    f.close()
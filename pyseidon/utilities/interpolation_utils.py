@@ -8,6 +8,10 @@ import matplotlib.tri as Tri
 import matplotlib.ticker as ticker
 from matplotlib.path import Path
 from scipy.spatial import KDTree
+from read_utils import read_columns
+
+#Points with a barycentric weight below -TOLERANCE are outside the element
+TOLERANCE = 1e-10
 
 def closest_point( pt_lon, pt_lat, lon, lat, debug=False):
     '''
@@ -140,7 +144,7 @@ def interpE_at_pt(var, pt_x, pt_y, xc, yc, index, triele, trinodes,
       - pt_y = y coordinate in m to find
       - xc = list of x coordinates of var, numpy array, dim= nele
       - yc = list of y coordinates of var, numpy array, dim= nele
-      - triele = FVCOM triele, numpy array, dim=(3,nele)
+      - triele = FVCOM triele, numpy array, dim=(nele,3), counting from 1
       - trinodes = FVCOM trinodes, numpy array, dim=(3,nele)
       - index = index of the nearest element
       - a1u, a2u = grid parameters
@@ -150,53 +154,24 @@ def interpE_at_pt(var, pt_x, pt_y, xc, yc, index, triele, trinodes,
     if debug:
         print 'Interpolating at element...'
 
-    n1 = int(triele[index,0])
-    n2 = int(triele[index,1])
-    n3 = int(triele[index,2])
-    #TR comment: not quiet sure what this step does
-    if n1==0: n1 = trinodes.shape[1]
-    if n2==0: n2 = trinodes.shape[1]
-    if n3==0: n3 = trinodes.shape[1]
-
+    #triele counts from 1, 0 means no neighbour, which contributes nothing
+    nbe = [int(triele[index,k]) for k in range(3)]
     #TR quick fix: due to error with pydap.proxy.ArrayProxy
     #              not able to cop with numpy.int
-    n1 = int(n1)
-    n2 = int(n2)
-    n3 = int(n3)
+    columns = [int(index)] + [max(n - 1, 0) for n in nbe]
+    mask = [1.0] + [float(n > 0) for n in nbe]
 
     x0 = pt_x - xc[index]
     y0 = pt_y - yc[index]
 
-    if len(var.shape)==1:
-        dvardx = (a1u[0,index] * var[index]) \
-               + (a1u[1,index] * var[n1]) \
-               + (a1u[2,index] * var[n2]) \
-               + (a1u[3,index] * var[n3])
-        dvardy = (a2u[0,index] * var[index]) \
-               + (a2u[1,index] * var[n1]) \
-               + (a2u[2,index] * var[n2]) \
-               + (a2u[3,index] * var[n3])
-        varPt = var[index] + (dvardx * x0) + (dvardy * y0)
-    elif len(var.shape)==2:
-        dvardx = (a1u[0,index] * var[:,index]) \
-               + (a1u[1,index] * var[:,n1]) \
-               + (a1u[2,index] * var[:,n2]) \
-               + (a1u[3,index] * var[:,n3])
-        dvardy = (a2u[0,index] * var[:,index]) \
-               + (a2u[1,index] * var[:,n1]) \
-               + (a2u[2,index] * var[:,n2]) \
-               + (a2u[3,index] * var[:,n3])
-        varPt = var[:,index] + (dvardx * x0) + (dvardy * y0)
-    else:
-        dvardx = (a1u[0,index] * var[:,:,index]) \
-               + (a1u[1,index] * var[:,:,n1]) \
-               + (a1u[2,index] * var[:,:,n2]) \
-               + (a1u[3,index] * var[:,:,n3])
-        dvardy = (a2u[0,index] * var[:,:,index]) \
-               + (a2u[1,index] * var[:,:,n1]) \
-               + (a2u[2,index] * var[:,:,n2]) \
-               + (a2u[3,index] * var[:,:,n3])
-        varPt = var[:,:,index] + (dvardx * x0) + (dvardy * y0)
+    lead = (slice(None),) * (len(var.shape) - 1)
+    values = [var[lead + (n,)] for n in columns]
+    dvardx = 0.0
+    dvardy = 0.0
+    for k in range(4):
+        dvardx = dvardx + (mask[k] * a1u[k,index] * values[k])
+        dvardy = dvardy + (mask[k] * a2u[k,index] * values[k])
+    varPt = values[0] + (dvardx * x0) + (dvardy * y0)
 
     if debug:
         if len(var.shape)==1:
@@ -206,6 +181,105 @@ def interpE_at_pt(var, pt_x, pt_y, xc, yc, index, triele, trinodes,
     #TR comment: squeeze seems to resolve my problem with pydap
     return varPt.squeeze()
 
+def barycentric(pt_lon, pt_lat, lon, lat, trinodes, index):
+    """
+    Barycentric weights of points within given elements.
+
+    Inputs:
+    ------
+      - pt_lon = longitudes in degrees, 1D array (npoint)
+      - pt_lat = latitudes in degrees, 1D array (npoint)
+      - lon = longitudes of the nodes, numpy array, dim=node
+      - lat = latitudes of the nodes, numpy array, dim=node
+      - trinodes = FVCOM trinodes, numpy array, dim=(nele,3)
+      - index = element of each point, 1D array (npoint)
+    Outputs:
+      - weights = weights of the nodes trinodes[index], 2D array (npoint,3)
+
+    Notes:
+    -----
+      - weights sum to one and are linear extrapolation weights for points
+        outside their element, i.e. when one is below -TOLERANCE, and
+        nan for degenerated elements
+    """
+    pt_lon = np.asarray(pt_lon, dtype=np.float64)
+    pt_lat = np.asarray(pt_lat, dtype=np.float64)
+    nodes = np.asarray(trinodes[index], dtype=int)
+    x = np.asarray(lon, dtype=np.float64)[nodes]
+    y = np.asarray(lat, dtype=np.float64)[nodes]
+    det = (y[:,1] - y[:,2]) * (x[:,0] - x[:,2]) \
+        + (x[:,2] - x[:,1]) * (y[:,0] - y[:,2])
+    #TR: degenerated elements give nan weights
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w1 = ((y[:,1] - y[:,2]) * (pt_lon - x[:,2]) +
+              (x[:,2] - x[:,1]) * (pt_lat - y[:,2])) / det
+        w2 = ((y[:,2] - y[:,0]) * (pt_lon - x[:,2]) +
+              (x[:,0] - x[:,2]) * (pt_lat - y[:,2])) / det
+
+    return np.column_stack((w1, w2, 1.0 - w1 - w2))
+
+def node_weights(pt_x, pt_y, xc, yc, index, trinodes, aw0, awx, awy):
+    """
+    Interpolation weights of node variables at many locations.
+    Inputs:
+      - pt_x = x coordinates in m, 1D array (npoint)
+      - pt_y = y coordinates in m, 1D array (npoint)
+      - xc = list of x coordinates of the elements, numpy array, dim= ele
+      - yc = list of y coordinates of the elements, numpy array, dim= ele
+      - index = containing element of each point, 1D array (npoint)
+      - trinodes = FVCOM trinodes, numpy array, dim=(nele,3)
+      - aw0, awx, awy = grid parameters
+    Outputs:
+      - columns = nodes used by each point, 2D array (3, npoint)
+      - weights = weights of these nodes, 2D array (3, npoint)
+
+    Notes:
+    -----
+      - var at point i is sum(weights[:,i] * var[..., columns[:,i]])
+    """
+    index = np.asarray(index, dtype=int)
+    x0 = np.asarray(pt_x) - np.asarray(xc)[index]
+    y0 = np.asarray(pt_y) - np.asarray(yc)[index]
+    weights = read_columns(aw0, index) \
+            + read_columns(awx, index) * x0 \
+            + read_columns(awy, index) * y0
+    columns = np.asarray(trinodes[index], dtype=int).T
+
+    return columns, weights
+
+def element_weights(pt_x, pt_y, xc, yc, index, triele, a1u, a2u):
+    """
+    Interpolation weights of element variables at many locations.
+    Inputs:
+      - pt_x = x coordinates in m, 1D array (npoint)
+      - pt_y = y coordinates in m, 1D array (npoint)
+      - xc = list of x coordinates of the elements, numpy array, dim= nele
+      - yc = list of y coordinates of the elements, numpy array, dim= nele
+      - index = containing element of each point, 1D array (npoint)
+      - triele = FVCOM triele, numpy array, dim=(nele,3)
+      - a1u, a2u = grid parameters
+    Outputs:
+      - columns = element and its neighbours used by each point,
+                  2D array (4, npoint)
+      - weights = weights of these elements, 2D array (4, npoint)
+
+    Notes:
+    -----
+      - triele holds FVCOM neighbour numbers, i.e. starting at 1, and 0
+        where there is no neighbour, which then contributes nothing
+      - var at point i is sum(weights[:,i] * var[..., columns[:,i]])
+    """
+    index = np.asarray(index, dtype=int)
+    x0 = np.asarray(pt_x) - np.asarray(xc)[index]
+    y0 = np.asarray(pt_y) - np.asarray(yc)[index]
+    nbe = np.asarray(triele[index], dtype=int).T
+    weights = read_columns(a1u, index) * x0 + read_columns(a2u, index) * y0
+    weights[1:] *= (nbe > 0)
+    weights[0] += 1.0
+    columns = np.vstack((index, np.maximum(nbe - 1, 0)))
+
+    return columns, weights
+
 def interp_at_point(var, pt_lon, pt_lat, lon, lat,
                     index=[], trinodes=[], tri=[], debug=False):
     """
@@ -218,57 +292,39 @@ def interp_at_point(var, pt_lon, pt_lat, lon, lat,
       - pt_lat = latitude in degrees to find
       - lon = list of longitudes of var, numpy array, dim=(nele or node)
       - lat = list of latitudes of var, numpy array, dim=(nele or node)
-      - trinodes = FVCOM trinodes, numpy array, dim=(3,nele)
+      - trinodes = FVCOM trinodes, numpy array, dim=(nele,3)
     Outputs:
       - varInterp = var interpolate at (pt_lon, pt_lat)
+
+    Notes:
+    -----
+      - linear interpolation within the triangle trinodes[index], with
+        barycentric weights computed once for all time steps and levels
+      - points outside the triangle are masked, as by matplotlib
+        interpolators, i.e. masked for 1D var and nan otherwise
+      - tri is not used anymore and only kept for compatibility
     """
     if debug:
         print 'Interpolating at point...'
     #Finding the right indexes
-
-    #Triangulation
-    #if debug:
-    #    print triIndex, lon[triIndex], lat[triIndex]
     triIndex = trinodes[index]
-    if tri==[]:
-        tri = Tri.Triangulation(lon[triIndex], lat[triIndex], np.array([[0,1,2]]))
-
-    trif = tri.get_trifinder()
-    trif.__call__(pt_lon, pt_lat)
+    weights = barycentric([pt_lon], [pt_lat], lon, lat, trinodes, [index])[0]
     if debug:
+        print 'Nodes: ', triIndex, 'Weights: ', weights
+    if weights.min() < -TOLERANCE:
+        if debug:
+            print 'Point outside the triangle'
         if len(var.shape)==1:
-            averEl = var[triIndex]
-            print 'Var', averEl
-            inter = Tri.LinearTriInterpolator(tri, averEl)
-            zi = inter(pt_lon, pt_lat)
-            print 'zi', zi
+            return np.ma.masked_array(np.nan, mask=True)
+        return np.nan * np.ones(var.shape[:-1]).squeeze()
 
-    #Choose the right interpolation depending on the variable
-    if len(var.shape)==1:
-        triVar = np.zeros(triIndex.shape)
-        triVar = var[triIndex]
-        inter = Tri.LinearTriInterpolator(tri, triVar[:])
-        varInterp = inter(pt_lon, pt_lat)      
-    elif len(var.shape)==2:
-        triVar = np.zeros((var.shape[0], triIndex.shape[0]))
-        triVar = var[:, triIndex]
-        varInterp = np.ones(triVar.shape[0])
-        for i in range(triVar.shape[0]):
-            inter = Tri.LinearTriInterpolator(tri, triVar[i,:])
-            varInterp[i] = inter(pt_lon, pt_lat)       
-    else:
-        triVar = np.zeros((var.shape[0], var.shape[1], triIndex.shape[0]))
-        triVar = var[:, :, triIndex]
-        varInterp = np.ones(triVar.shape[:-1])
-        for i in range(triVar.shape[0]):
-           for j in range(triVar.shape[1]):
-               inter = Tri.LinearTriInterpolator(tri, triVar[i,j,:])
-               varInterp[i,j] = inter(pt_lon, pt_lat)
+    #Same weights for all the time steps and levels
+    triVar = np.asarray(var[(slice(None),) * (len(var.shape) - 1) +
+                            (triIndex,)])
+    varInterp = np.dot(triVar, weights)
 
     if debug:
         print '...Passed'
 
     #TR comment: squeeze seems to resolve my problem with pydap
     return varInterp.squeeze()
-
-
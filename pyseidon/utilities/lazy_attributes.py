@@ -0,0 +1,65 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+from read_utils import run_tasks
+
+class LazyAttributes(object):
+    """
+    Description:
+    -----------
+    Base class for the 'Variables' and 'Grid' subsets whose arrays are only
+    read from file when they are accessed for the first time.
+
+    A loader, i.e. any callable returning the array, is registered under the
+    attribute name. On first access the loader is called, its result is
+    stored as a regular attribute and the loader is discarded, so that the
+    following accesses cost nothing.
+
+    Notes:
+    -----
+      - hasattr(obj, name) triggers the loading of a registered attribute
+      - _load_all must be called before pickling or saving
+      - a loader may also carry a 'plan' function returning the output
+        array and the list of its reads, in which case _load_all runs the
+        reads of all the pending attributes on a single pool of
+        self._workers threads
+    """
+    def _register(self, name, loader):
+        """Register loader to be called on first access to name"""
+        self.__dict__.setdefault('_loaders', {})[name] = loader
+
+    def _pending(self):
+        """Return the names of the attributes not loaded yet"""
+        return self.__dict__.get('_loaders', {}).keys()
+
+    def _load_all(self, names=None):
+        """Force the loading of the registered attributes, all by default"""
+        loaders = self.__dict__.get('_loaders', {})
+        if names is None:
+            names = loaders.keys()
+        names = [name for name in names if name in loaders]
+        workers = self.__dict__.get('_workers', 1)
+        planned = [name for name in names if hasattr(loaders[name], 'plan')]
+        if workers > 1 and len(planned) > 1:
+            outs = {}
+            tasks = []
+            for name in planned:
+                outs[name], reads = loaders[name].plan()
+                tasks.extend(reads)
+            run_tasks(tasks, workers=workers)
+            for name in planned:
+                setattr(self, name, outs[name])
+                del loaders[name]
+        for name in names:
+            getattr(self, name)
+
+    def __getattr__(self, name):
+        #Only called when name is not a regular attribute
+        loaders = self.__dict__.get('_loaders', {})
+        if name in loaders:
+            value = loaders[name]()
+            setattr(self, name, value)
+            del loaders[name]
+            return value
+        raise AttributeError(name)
@@ -0,0 +1,263 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import numpy as np
+import numexpr as ne
+import tempfile
+from regioner import element_region
+from time_axis import TimeAxis
+
+#Derived fields of Util2D, (ntime, nele), and Util3D, (ntime, nlevel, nele),
+#with the numexpr expression of the velocities that computes them when no
+#dtype is given, None when they are computed in float64
+DERIVED2D = [('hori_velo_norm', 'sqrt(u**2 + v**2)'),
+             ('depth_av_flow_dir', 'arctan2(v, u)'),
+             ('depth_av_vorticity', None),
+             ('depth_av_power_density', '0.5*1025.0*(sqrt(u**2 + v**2)**3)'),
+             ('depth_av_power_assessment', None)]
+DERIVED3D = [('velo_norm', 'sqrt(u**2 + v**2)'),
+             ('flow_dir', 'arctan2(v, u)'),
+             ('vorticity', None),
+             ('power_density', '0.5*1025.0*(sqrt(u**2 + v**2)**3)'),
+             ('power_assessment', None),
+             ('verti_shear', None)]
+#Derived fields of the elevation, computed in float64 when no dtype is given
+ELEVATION2D = ['elc', 'depth2D']
+ELEVATION3D = ['depth']
+
+def allocate(shape, dtype=float, max_memory=None):
+    """
+    Allocate an array in memory, or in a temporary file if too large.
+
+    Inputs:
+    ------
+      - shape = shape of the array, tuple of integers
+
+    Outputs:
+    -------
+      - out = uninitialised numpy array or numpy memmap
+
+    Keywords:
+    --------
+      - dtype = type of the array
+      - max_memory = memory budget in bytes, integer. No limit if None
+
+    Notes:
+    -----
+      - the temporary file is removed as soon as the array is released
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    if max_memory is None or nbytes <= max_memory or nbytes==0:
+        return np.empty(shape, dtype=dtype)
+    #TR: the mapping outlives the file object, which is deleted on close
+    f = tempfile.TemporaryFile()
+    try:
+        out = np.memmap(f, dtype=dtype, mode='w+', shape=shape)
+    finally:
+        f.close()
+    return out
+
+def time_chunks(ntime, step_bytes, max_memory=None):
+    """
+    Split time steps into chunks fitting the memory budget.
+
+    Inputs:
+    ------
+      - ntime = number of time steps, integer
+      - step_bytes = memory needed per time step in bytes, integer
+
+    Outputs:
+    -------
+      - chunks = list of slices along time
+
+    Keywords:
+    --------
+      - max_memory = memory budget in bytes, integer. One chunk if None
+    """
+    if max_memory is None or step_bytes * ntime <= max_memory:
+        return [slice(0, ntime)]
+    step = max(1, int(max_memory // max(step_bytes, 1)))
+    return [slice(t, min(t + step, ntime)) for t in range(0, ntime, step)]
+
+def evaluate(ex, local_dict, dtype=None, max_memory=None):
+    """
+    numexpr evaluation of ex written straight into an array of type dtype
+
+    Inputs:
+    ------
+      - ex = numexpr expression, string, ex: 'sqrt(u**2 + v**2)'
+      - local_dict = operands of ex, dictionary, ex: {'u': u, 'v': v}
+
+    Outputs:
+    -------
+      - out = result, numpy array
+
+    Keywords:
+    --------
+      - dtype = type of the output, numexpr's own type if None
+      - max_memory = memory budget in bytes, integer. No limit if None
+
+    Notes:
+    -----
+      - numexpr computes in float64 as soon as a float constant appears in
+        ex, the result is then cast block by block, i.e. without any
+        float64 temporary array
+      - beyond max_memory, ex is evaluated by chunks of time steps (first
+        dimension) and the output may be stored in a temporary file
+    """
+    if dtype is None and max_memory is None:
+        return ne.evaluate(ex, local_dict=local_dict)
+    shape = _broadcast_shape(local_dict.values())
+    if len(shape)==0:
+        return ne.evaluate(ex, local_dict=local_dict)
+    if dtype is None:
+        #numexpr's own type, from the first item of the operands
+        dtype = ne.evaluate(ex, local_dict=dict(
+                [(k, _head(v)) for k, v in local_dict.items()])).dtype
+    out = allocate(shape, dtype=dtype, max_memory=max_memory)
+    #Operands along time are sliced, the others are broadcast as they are
+    timed = [k for k, v in local_dict.items()
+             if len(np.shape(v))==len(shape) and np.shape(v)[0]==shape[0]]
+    #TR: counted as float64, numexpr's working type
+    step = 8 * int(np.prod(shape[1:])) * (len(timed) + 1)
+    for t in time_chunks(shape[0], step, max_memory):
+        chunk = dict(local_dict)
+        for k in timed:
+            chunk[k] = np.asarray(local_dict[k][t])
+        ne.evaluate(ex, local_dict=chunk, out=out[t], casting='same_kind')
+
+    return out
+
+def _broadcast_shape(operands):
+    """Broadcast shape of the operands, without reading them"""
+    dummies = []
+    for value in operands:
+        shape = np.shape(value)
+        dummies.append(np.lib.stride_tricks.as_strided(np.zeros(1),
+                       shape=shape, strides=(0,) * len(shape)))
+    return np.broadcast(*dummies).shape
+
+def _head(value):
+    """First item of value along each dimension"""
+    n = len(np.shape(value))
+    if n==0:
+        return value
+    return np.asarray(value[(slice(0, 1),) * n])
+
+def estimate(data, ax=[], tx=[], variables=[], exclude=[], dtype=None,
+             debug=False):
+    """
+    Estimate the memory needed by the FVCOM fields.
+
+    Inputs:
+    ------
+      - data = netcdf file or OpenDap dataset, with data.variables
+
+    Outputs:
+    -------
+      - sizes = bytes needed per field, dictionary
+
+    Keywords:
+    --------
+      - ax = region, see FVCOM class
+      - tx = time period, ['yyyy-mm-ddThh:mm:ss', 'yyyy-mm-ddThh:mm:ss']
+      - variables = variables to load, list of strings. All if empty
+      - exclude = variables not to load, list of strings
+      - dtype = storage type, see FVCOM class
+
+    Notes:
+    -----
+      - only the dimensions are used, plus the coordinates and time
+        variables if ax or tx are given
+      - full-domain fields are links to the file when dtype is None,
+        they are counted as if they were loaded, in the type of the file
+      - fields derived from the elevation are counted as soon as el is
+        loaded, those derived from the velocities with ua and va, or u and v
+    """
+    var = data.variables
+    nele = var['lonc'].shape[0]
+    nnode = var['lon'].shape[0]
+    ntime = var['time'].shape[0]
+    #Dimensions within bounding box
+    if len(ax) > 0:
+        if debug: print "Computing bounding box dimensions..."
+        nv = np.transpose(var['nv'][:]) - 1
+        element_index = element_region(ax, var['lon'][:], var['lat'][:],
+                                       var['lonc'][:], var['latc'][:], nv)
+        nele_ax = element_index.shape[0]
+        nnode_ax = np.unique(nv[element_index,:]).shape[0]
+    else:
+        nele_ax = nele
+        nnode_ax = nnode
+    #Dimensions within time period
+    if not tx==[]:
+        if debug: print "Computing time period dimension..."
+        julianTime = np.asarray(var['time'][:])
+        start, end = TimeAxis(julianTime + 678942.0).bounds(tx[0], tx[1])
+        ntime_tx = end - start
+    else:
+        ntime_tx = ntime
+
+    #Loaded fields
+    kwl = ['ua', 'va', 'zeta', 'ww', 'u', 'v', 'gls', 'tke']
+    al = ['ua', 'va', 'el', 'w', 'u', 'v', 'gls', 'tke']
+    #Without dtype, full-domain fields of a single file are links to it,
+    #in its own type, the others are loaded in float64, see Variables
+    linked = len(ax)==0 and tx==[] and getattr(data, 'files', None) is None
+    sizes = {}
+    types = {}
+    for key, alias in zip(kwl, al):
+        if not (variables==[] or alias in variables) or alias in exclude:
+            continue
+        try:
+            shape = var[key].shape
+        except KeyError:
+            continue
+        if not dtype is None:
+            types[alias] = np.dtype(dtype)
+        elif linked:
+            #TR: pydap proxies do not carry a dtype, FVCOM outputs are float32
+            source = getattr(getattr(var[key], 'data', None), 'dtype', None)
+            if source is None:
+                source = np.float32
+            types[alias] = np.dtype(source)
+        else:
+            types[alias] = np.dtype(np.float64)
+        if shape[-1]==nele:
+            last = nele_ax
+        else:
+            last = nnode_ax
+        size = ntime_tx * int(np.prod(shape[1:-1])) * last
+        sizes[alias] = size * types[alias].itemsize
+
+    #Derived fields
+    nlevel = var['siglay'].shape[0]
+    if 'el' in sizes:
+        itemsize = _derived_itemsize(None, [], dtype)
+        for name in ELEVATION2D:
+            sizes[name] = ntime_tx * nele_ax * itemsize
+        for name in ELEVATION3D:
+            sizes[name] = ntime_tx * nlevel * nele_ax * itemsize
+    if 'ua' in sizes and 'va' in sizes:
+        for name, ex in DERIVED2D:
+            itemsize = _derived_itemsize(ex, [types['ua'], types['va']],
+                                         dtype)
+            sizes[name] = ntime_tx * nele_ax * itemsize
+    if 'u' in sizes and 'v' in sizes:
+        for name, ex in DERIVED3D:
+            itemsize = _derived_itemsize(ex, [types['u'], types['v']], dtype)
+            sizes[name] = ntime_tx * nlevel * nele_ax * itemsize
+        sizes['verti_shear'] = sizes['verti_shear'] * (nlevel - 1) // nlevel
+
+    return sizes
+
+def _derived_itemsize(ex, types, dtype):
+    """Item size of a derived field of the velocities of given types"""
+    if not dtype is None:
+        return np.dtype(dtype).itemsize
+    if ex is None:
+        return 8
+    operands = dict(zip(['u', 'v'], [np.zeros(1, dtype=t) for t in types]))
+    return ne.evaluate(ex, local_dict=operands).dtype.itemsize
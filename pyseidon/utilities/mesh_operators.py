@@ -0,0 +1,142 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import numpy as np
+from scipy import sparse
+from memory_utils import allocate, time_chunks
+from read_utils import BLOCK_BYTES
+
+def gradient_operators(grid):
+    """
+    Sparse d/dx and d/dy operators of element variables, built on first call.
+
+    Inputs:
+    ------
+      - grid = FVCOM Grid
+
+    Outputs:
+    -------
+      - ddx, ddy = CSR matrices (nele, nele), such as
+                   dvardx = ddx * var for var of dim=(nele)
+
+    Notes:
+    -----
+      - from the a1u and a2u grid parameters, which weight an element and
+        its 3 neighbours in triele. triele counts from 1 and 0 means no
+        neighbour, which then contributes nothing
+      - the operators are stored in the grid, as _ddx and _ddy, and
+        rebuilt if the grid size changed
+    """
+    ops = getattr(grid, '_ddx', None), getattr(grid, '_ddy', None)
+    nele = grid.nele
+    if ops[0] is None or ops[1] is None or not ops[0].shape==(nele, nele):
+        nbe = np.asarray(grid.triele[:], dtype=int).T
+        rows = np.tile(np.arange(nele), 4)
+        cols = np.vstack((np.arange(nele), np.maximum(nbe - 1, 0))).ravel()
+        keep = np.vstack((np.ones(nele, bool), nbe > 0)).ravel()
+        ops = []
+        for coef in [grid.a1u, grid.a2u]:
+            values = np.asarray(coef[:], dtype=np.float64).ravel()
+            ops.append(sparse.csr_matrix((values[keep],
+                                         (rows[keep], cols[keep])),
+                                         shape=(nele, nele)))
+        grid._ddx, grid._ddy = ops
+    return ops[0], ops[1]
+
+def node_to_element(grid):
+    """
+    Sparse node to element averaging operator, built on first call.
+
+    Inputs:
+    ------
+      - grid = FVCOM Grid
+
+    Outputs:
+    -------
+      - n2e = CSR matrix (nele, nnode), such as
+              varc = n2e * var for var of dim=(nnode)
+
+    Notes:
+    -----
+      - each element gets the mean of its 3 nodes in trinodes
+      - the operator is stored in the grid, as _n2e, and rebuilt if the
+        grid size changed
+    """
+    op = getattr(grid, '_n2e', None)
+    nele = grid.nele
+    nnode = grid.nnode
+    if op is None or not op.shape==(nele, nnode):
+        trinodes = np.asarray(grid.trinodes[:], dtype=int)
+        rows = np.repeat(np.arange(nele), 3)
+        op = sparse.csr_matrix((np.ones(3 * nele) / 3.0,
+                               (rows, trinodes.ravel())),
+                               shape=(nele, nnode))
+        grid._n2e = op
+    return op
+
+def apply_operator(op, var):
+    """
+    Apply a sparse operator along the last dimension of an array.
+
+    Inputs:
+    ------
+      - op = sparse matrix (nrow, ncol)
+      - var = numpy array, dim=(ncol), (time, ncol) or (time, level, ncol)
+
+    Outputs:
+    -------
+      - out = numpy array, dim=(nrow), (time, nrow) or (time, level, nrow)
+    """
+    var = np.asarray(var)
+    lead = var.shape[:-1]
+    out = op.dot(var.reshape(-1, var.shape[-1]).T).T
+
+    return out.reshape(lead + (op.shape[0],))
+
+def operator_over_time(terms, ntime, time=None, dtype=float,
+                       max_memory=None):
+    """
+    Sum of sparse operators applied to variables, by chunks of time steps.
+
+    Inputs:
+    ------
+      - terms = list of (op, var) pairs, with var of dim=(time, ncol) or
+                (time, level, ncol)
+      - ntime = number of time steps of the output, integer
+
+    Outputs:
+    -------
+      - out = sum of op * var, numpy array or memmap,
+              dim=(ntime, nrow) or (ntime, level, nrow)
+
+    Keywords:
+    --------
+      - time = time indices of the vars, 1D array (ntime). All by default
+      - dtype = type of the output
+      - max_memory = memory budget in bytes, integer. Chunks are limited
+                     to read_utils.BLOCK_BYTES if None
+
+    Notes:
+    -----
+      - ex: vorticity = operator_over_time([(ddx, v), (-ddy, u)], ntime)
+    """
+    op, var = terms[0]
+    shape = (ntime,) + tuple(var.shape[1:-1]) + (op.shape[0],)
+    out = allocate(shape, dtype=dtype, max_memory=max_memory)
+    budget = max_memory
+    if budget is None:
+        budget = BLOCK_BYTES
+    #TR: counted as float64, input block, product and its transpose
+    step = 8 * int(np.prod(shape[1:])) * 3 * len(terms)
+    for t in time_chunks(ntime, step, budget):
+        if time is None:
+            index = t
+        else:
+            index = np.asarray(time)[t]
+        block = 0.0
+        for op, var in terms:
+            block = block + apply_operator(op, var[index])
+        out[t] = block
+
+    return out
@@ -9,7 +9,8 @@ import fnmatch
 import os
 import sys
 from scipy.io import netcdf
-from pydap.client import open_url
+from opendap_utils import open_url
+from time_axis import TimeAxis, datenum_to_datetime64
 
 def date2py(matlab_datenum):
     python_datetime = datetime.fromordinal(int(matlab_datenum)) + \
@@ -102,37 +103,38 @@ def depth_at_FVCOM_element(ind, trinodes, time_ind):
 
 def time_to_index(t_start, t_end, time, debug=False):
     """Convert datetime64[us] string in FVCOM index"""
-    # Find simulation time contains in [t_start, t_end]
-    t = time.shape[0]
-    l = []
-    #TR comment: is it the accurate way to convert?
-    for i in range(t):
-        date = datetime.fromordinal(int(time[i])) + \
-               timedelta(days=time[i]%1)-timedelta(days=366)
-        l.append(date)
-    time = np.array(l,dtype='datetime64[us]')
-    t_slice = [t_start, t_end]
-    t_slice = np.array(t_slice,dtype='datetime64[us]')
-
-    if t_slice.shape[0] != 1:
-        argtime = np.argwhere((time>=t_slice[0])&
-                              (time<=t_slice[-1])).flatten()
-    if debug:
-        print 'Argtime: ', argtime
-    if argtime == []:
-        print "Wrong time input"
-        sys.exit()
-    return argtime
+    #TR comment: prefer time_axis(Variables).index, built only once
+    return TimeAxis(time).index(t_start, t_end, debug=debug)
 
 def mattime_to_datetime(mattime, debug=False):
     """Convert matlab time to datetime64[us] """
-    l = []
-    date = datetime.fromordinal(int(mattime)) + \
-               timedelta(days=mattime%1)-timedelta(days=366)
-    l.append(date)
-    time = np.array(l,dtype='datetime64[us]')
+    return datenum_to_datetime64(np.atleast_1d(mattime))
+
+def select_variables(keys, aliases, variables=[], exclude=[]):
+    """
+    Restrict lists of file keywords to the requested variables
+
+    Inputs:
+    ------
+      - keys = keywords in file, list of strings
+      - aliases = corresponding variable names, list of strings
+
+    Outputs:
+    -------
+      - keys, aliases = selected keywords and names, lists of strings
+
+    Keywords:
+    --------
+      - variables = names to keep, list of strings. All if empty
+      - exclude = names to drop, list of strings
+    """
+    pairs = [(key, alias) for key, alias in zip(keys, aliases)
+             if (variables==[] or alias in variables)
+             and not alias in exclude]
+    keys = [key for key, alias in pairs]
+    aliases = [alias for key, alias in pairs]
 
-    return time
+    return keys, aliases
 
 def findFiles(filename, name):
     '''
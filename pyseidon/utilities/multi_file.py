@@ -0,0 +1,219 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import os
+import numpy as np
+from scipy.io import netcdf
+from opendap_utils import open_url
+from catalogue import catalogue_files
+
+def is_multi(filename):
+    """Tells if filename points to a folder or a glob pattern of files"""
+    if filename.startswith('http'):
+        return False
+    return os.path.isdir(filename) or \
+           any([c in os.path.basename(filename) for c in '*?['])
+
+def _is_timed(var):
+    """Tells if var has time as first dimension"""
+    dims = getattr(var, 'dimensions', ())
+    return len(dims) > 0 and dims[0]=='time'
+
+def _open(filename):
+    """Open a netcdf file or OpenDap url, quietly"""
+    if filename.startswith('http'):
+        data = open_url(filename)
+        #Create fake attribut to be consistent with the rest of the code
+        data.variables = data
+        return data
+    return netcdf.netcdf_file(filename, 'r', mmap=True)
+
+class MultiVariable(object):
+    """
+    Description:
+    -----------
+    Variable with time as first dimension, spread over several files.
+
+    Indexing works as for a numpy array: the requested time steps are read
+    from the files they belong to, with one contiguous read per file, and
+    nothing is read beforehand.
+
+    Inputs:
+    ------
+      - parts = same variable in each file, list of netcdf variables or
+                OpenDap proxies
+      - keep = time steps used in each file, list of slices
+    """
+    def __init__(self, parts, keep):
+        self._parts = parts
+        self._keep = keep
+        counts = [len(xrange(*k.indices(p.shape[0])))
+                  for p, k in zip(parts, keep)]
+        #Virtual index of the first time step of each file
+        self._starts = np.cumsum([0] + counts)
+        self.shape = (int(self._starts[-1]),) + tuple(parts[0].shape[1:])
+        self.dimensions = getattr(parts[0], 'dimensions', ())
+        self.dtype = getattr(getattr(parts[0], 'data', None), 'dtype', None)
+        if self.dtype is None:
+            self.dtype = getattr(parts[0], 'dtype', None)
+
+    @property
+    def data(self):
+        """Same interface as netcdf variables and OpenDap proxies"""
+        return self
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        out = self[:]
+        if dtype is None:
+            return out
+        return out.astype(dtype)
+
+    def _read(self, start, stop, rest):
+        """Read the virtual time steps start:stop, rest applied per file"""
+        blocks = []
+        first = np.searchsorted(self._starts, start, side='right') - 1
+        for i in range(max(first, 0), len(self._parts)):
+            if self._starts[i] >= stop:
+                break
+            a = max(start, self._starts[i]) - self._starts[i]
+            b = min(stop, self._starts[i+1]) - self._starts[i]
+            k = self._keep[i].start
+            blocks.append(np.asarray(self._parts[i][(slice(k + a, k + b),)
+                                                    + rest]))
+        if len(blocks)==1:
+            return blocks[0]
+        return np.concatenate(blocks, axis=0)
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+        #Expand Ellipsis
+        if any([i is Ellipsis for i in index]):
+            at = [i is Ellipsis for i in index].index(True)
+            fill = len(self.shape) - len(index) + 1
+            index = index[:at] + (slice(None),) * fill + index[at+1:]
+        t, rest = index[0], index[1:]
+        #Other dimensions are read per file unless advanced indexing is used,
+        #in which case numpy rules apply to the whole index afterwards
+        basic = all([isinstance(i, (int, long, np.integer, slice))
+                     for i in rest])
+        n = self.shape[0]
+        if isinstance(t, (int, long, np.integer)):
+            if t < 0:
+                t += n
+            if not 0 <= t < n:
+                raise IndexError('time index out of range')
+            start, stop, tnew = t, t + 1, 0
+        elif isinstance(t, slice):
+            pos = np.arange(n)[t]
+            if pos.shape[0]==0:
+                start = stop = 0
+                tnew = slice(0, 0)
+            else:
+                start, stop = pos.min(), pos.max() + 1
+                begin, end, step = t.indices(n)
+                end = end - start
+                if end < 0:
+                    end = None
+                tnew = slice(begin - start, end, step)
+        else:
+            pos = np.arange(n)[np.asarray(t)]
+            if pos.shape[0]==0:
+                start = stop = 0
+                tnew = pos
+            else:
+                #One contiguous read per file, between its extreme steps
+                used = np.unique(pos)
+                blocks = []
+                for i in range(len(self._parts)):
+                    inside = used[(used >= self._starts[i]) &
+                                  (used < self._starts[i+1])]
+                    if inside.shape[0]==0:
+                        continue
+                    block = self._read(inside[0], inside[-1] + 1,
+                                       rest if basic else ())
+                    blocks.append(block[inside - inside[0]])
+                block = np.concatenate(blocks, axis=0)
+                tnew = np.searchsorted(used, pos)
+                if basic:
+                    return block[tnew]
+                return block[(tnew,) + rest]
+        block = self._read(start, stop, rest if basic else ())
+        if basic:
+            return block[tnew]
+        return block[(tnew,) + rest]
+
+class MultiDataset(object):
+    """
+    Description:
+    -----------
+    Several FVCOM output files seen as a single file with one time axis.
+
+    Variables with time as first dimension are MultiVariable, i.e. reads
+    of a time range are routed to the files holding it. The others, e.g.
+    grid variables, are taken from the first file only.
+
+    Inputs:
+    ------
+      - filename = path to folder or glob pattern, string,
+                   ex: './run/' or './run/dngrid_00*.nc'
+
+    Keywords:
+    --------
+      - files = paths to the files, list of strings. Found from filename
+                by default
+      - tx = time period, ['yyyy-mm-ddThh:mm:ss', 'yyyy-mm-ddThh:mm:ss'].
+             Only the files overlapping tx are opened, see catalogue
+
+    Notes:
+    -----
+      - files are ordered by their first time step
+      - time steps already covered by the previous file, i.e. restart
+        overlaps, are skipped
+    """
+    def __init__(self, filename, files=None, tx=[], debug=False):
+        if files is None:
+            files = catalogue_files(filename, tx=tx, kind='fvcom',
+                                    debug=debug)
+        if files==[]:
+            raise IOError('No *.nc file found for ' + filename)
+        self.filename = filename
+        datasets = [_open(f) for f in files]
+        times = [np.asarray(d.variables['time'][:], dtype=np.float64)
+                 for d in datasets]
+        order = np.argsort([t[0] if t.shape[0] else np.inf for t in times],
+                           kind='mergesort')
+        self.files = []
+        self._datasets = []
+        keep = []
+        last = -np.inf
+        for i in order:
+            #Skip the steps already covered
+            first = int(np.searchsorted(times[i], last, side='right'))
+            if first >= times[i].shape[0]:
+                if debug: print "Skipping " + files[i]
+                continue
+            self.files.append(files[i])
+            self._datasets.append(datasets[i])
+            keep.append(slice(first, times[i].shape[0]))
+            last = times[i][-1]
+        #Consistency check
+        ref = self._datasets[0].variables
+        for d, f in zip(self._datasets[1:], self.files[1:]):
+            if not d.variables['nv'].shape==ref['nv'].shape:
+                raise ValueError('Grid of ' + f + ' does not match')
+
+        self.variables = {}
+        for key in ref.keys():
+            var = ref[key]
+            if _is_timed(var):
+                parts = [d.variables[key] for d in self._datasets]
+                self.variables[key] = MultiVariable(parts, keep)
+            else:
+                self.variables[key] = var
+        self.dimensions = dict(getattr(self._datasets[0], 'dimensions', {}))
+        self.dimensions['time'] = self.variables['time'].shape[0]
@@ -0,0 +1,125 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import numpy as np
+from scipy import sparse
+from interpolation_utils import barycentric, node_weights, element_weights
+from interpolation_utils import TOLERANCE
+from read_utils import read_columns
+from spatial_index import locate, spatial_index
+
+class Probe(object):
+    """
+    Description:
+    -----------
+    Virtual probes, i.e. interpolation at a fixed set of points.
+
+    The containing elements, the lon/lat to x/y conversion and the
+    interpolation weights are computed once. Node and element weights are
+    kept as two sparse operators over the few columns the points need, so
+    that interpolating any variable is one read of these columns and one
+    sparse matrix product.
+
+    Inputs:
+    ------
+      - grid = FVCOM Grid
+      - pt_lons = longitudes in decimal degrees East, list of floats
+      - pt_lats = latitudes in decimal degrees North, list of floats
+
+    Keywords:
+    --------
+      - index = containing element indices, list of integers. Found with
+                spatial_index.locate by default
+
+    Notes:
+    -----
+      - points outside the mesh, or outside their given element, are
+        listed in a warning and interpolated as nan, see .inside
+      - ex: probe = Probe(fvcom.Grid, lons, lats)
+            el = probe.apply(fvcom.Variables.el)
+            u = probe.apply(fvcom.Variables.u)
+      - probes can be pickled
+    """
+    def __init__(self, grid, pt_lons, pt_lats, index=[]):
+        self.lon = np.atleast_1d(np.asarray(pt_lons, dtype=np.float64))
+        self.lat = np.atleast_1d(np.asarray(pt_lats, dtype=np.float64))
+        if len(index)==0:
+            index = locate(grid, self.lon, self.lat, snap=False)
+            #Any element for the points outside, they are masked below
+            outside = index < 0
+            if np.any(outside):
+                index[outside] = spatial_index(grid).nearest(
+                                 self.lon[outside], self.lat[outside])
+        self.index = np.asarray(index, dtype=int)
+        self.npoint = self.index.shape[0]
+        self.nnode = grid.nnode
+        self.nele = grid.nele
+        trinodes = grid.trinodes[:]
+
+        # Conversion (lon, lat) to (x, y)
+        weights = barycentric(self.lon, self.lat, grid.lon[:], grid.lat[:],
+                              trinodes, self.index)
+        with np.errstate(invalid='ignore'):
+            self.inside = weights.min(axis=1) >= -TOLERANCE
+        if not self.inside.all():
+            print "---Points outside the mesh, interpolated as nan: " + \
+                  str(list(np.where(~self.inside)[0])) + "---"
+        nodes = trinodes[self.index]
+        self.x = (np.asarray(grid.x[:])[nodes] * weights).sum(axis=1)
+        self.y = (np.asarray(grid.y[:])[nodes] * weights).sum(axis=1)
+
+        xc = grid.xc[:]
+        yc = grid.yc[:]
+        self._node = self._operator(*node_weights(self.x, self.y, xc, yc,
+                                                  self.index, trinodes,
+                                                  grid.aw0, grid.awx,
+                                                  grid.awy))
+        self._element = self._operator(*element_weights(self.x, self.y,
+                                                        xc, yc, self.index,
+                                                        grid.triele[:],
+                                                        grid.a1u, grid.a2u))
+
+    def _operator(self, columns, weights):
+        """Used columns and sparse (npoint, ncolumn) weights"""
+        used, position = np.unique(columns, return_inverse=True)
+        rows = np.tile(np.arange(self.npoint), columns.shape[0])
+        matrix = sparse.csr_matrix((weights.ravel(),
+                                   (rows, position.ravel())),
+                                   shape=(self.npoint, used.shape[0]))
+        return used, matrix
+
+    def apply(self, var, lead=(), debug=False):
+        """
+        Interpolate a variable at the probes.
+
+        Inputs:
+        ------
+          - var = any FVCOM grid data or variable, numpy array,
+                  dim=(nele or node), (time, nele or node)
+                  or (time, level, nele or node)
+
+        Outputs:
+        -------
+          - varInterp = var at the probes, numpy array,
+                        dim=(point), (time, point) or (time, level, point).
+                        nan at the points outside the mesh
+
+        Keywords:
+        --------
+          - lead = slices along the leading dimensions, tuple of slices,
+                   ex: (slice(0, 144),) for the first 144 time steps only
+        """
+        if var.shape[-1]==self.nnode:
+            used, matrix = self._node
+        elif var.shape[-1]==self.nele:
+            used, matrix = self._element
+        else:
+            raise ValueError('var is neither a node nor an element variable')
+        block = read_columns(var, used, lead=lead, debug=debug)
+        lead = block.shape[:-1]
+        block = block.reshape(-1, used.shape[0])
+        varInterp = matrix.dot(block.T).T.reshape(lead + (self.npoint,))
+        varInterp[..., ~self.inside] = np.nan
+
+        return varInterp
@@ -0,0 +1,273 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import numpy as np
+from multiprocessing.pool import ThreadPool
+
+#Size in bytes of the time blocks read in one go
+BLOCK_BYTES = 64 * 1024**2
+#Maximum number of unwanted indices read in order to merge two runs
+GAP = 64
+
+def _itemsize(data):
+    """Item size in bytes of data"""
+    try:
+        return data.dtype.itemsize
+    except AttributeError:
+        #TR: pydap proxies do not carry a dtype, FVCOM outputs are float32
+        return 4
+
+def time_block_size(data, block_bytes=BLOCK_BYTES):
+    """
+    Number of time steps of data fitting in block_bytes.
+
+    Inputs:
+    ------
+      - data = array or OpenDap proxy with time as first dimension
+
+    Outputs:
+    -------
+      - size = number of time steps per block, integer (>= 1)
+    """
+    step = _itemsize(data) * int(np.prod(data.shape[1:]))
+    return max(1, int(block_bytes // max(step, 1)))
+
+def plan_reads(region, gap=GAP):
+    """
+    Coalesce indices into a few contiguous reads.
+
+    Consecutive indices are grouped into runs and runs separated by less
+    than gap unwanted indices are merged into a single read.
+
+    Inputs:
+    ------
+      - region = indices to read, list of integers, not necessarily sorted
+
+    Outputs:
+    -------
+      - reads = list of (start, stop, pos, idx) tuples, such as
+                out[..., pos] = data[..., start:stop][..., idx]
+
+    Keywords:
+    --------
+      - gap = maximum number of unwanted indices between two merged runs
+    """
+    region = np.asarray(region, dtype=int)
+    order = np.argsort(region, kind='mergesort')
+    sortd = region[order]
+    #Break where the distance between sorted indices exceeds the gap
+    breaks = np.where(np.diff(sortd) > (gap + 1))[0] + 1
+    reads = []
+    for pos in np.split(np.arange(sortd.shape[0]), breaks):
+        start = sortd[pos[0]]
+        stop = sortd[pos[-1]] + 1
+        reads.append((start, stop, order[pos], sortd[pos] - start))
+
+    return reads
+
+def run_tasks(tasks, workers=1):
+    """
+    Run independent tasks, i.e. callables without arguments.
+
+    Inputs:
+    ------
+      - tasks = list of callables
+
+    Keywords:
+    --------
+      - workers = number of threads, integer. This is also the maximum
+                  number of reads in flight at once
+
+    Notes:
+    -----
+      - tasks run in order in the calling thread if workers <= 1
+      - the first error raised by a task is raised again here
+    """
+    if workers > 1 and len(tasks) > 1:
+        pool = ThreadPool(min(workers, len(tasks)))
+        try:
+            pool.map(lambda task: task(), tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            task()
+
+def _copy_task(out, data, index):
+    """Task copying data[index] into out"""
+    def task():
+        out[...] = data[index]
+    return task
+
+def _take_task(out, data, index, region):
+    """Task gathering data[index][..., region] into out"""
+    def task():
+        block = data[index]
+        if out.dtype==block.dtype:
+            np.take(block, region, axis=-1, out=out, mode='clip')
+        else:
+            out[...] = np.take(block, region, axis=-1)
+    return task
+
+def _scatter(out, block, pos, idx):
+    """Scatter block[..., idx] into out[..., pos]"""
+    if block.shape[-1]==idx.shape[0] and np.all(np.diff(pos)==1):
+        out[..., pos[0]:pos[-1]+1] = block
+    else:
+        out[..., pos] = block[..., idx]
+
+def _scatter_task(out, data, index, pos, idx):
+    """Task reading data[index] and scattering idx into out[..., pos]"""
+    def task():
+        _scatter(out, np.asarray(data[index]), pos, idx)
+    return task
+
+def _column_tasks(out, data, lead, region, gap=GAP, debug=False):
+    """Tasks reading data[lead + (region,)] into out"""
+    if isinstance(data, np.ndarray):
+        return [_take_task(out, data, lead, region)]
+    tasks = []
+    for start, stop, pos, idx in plan_reads(region, gap=gap):
+        if debug: print 'Index bound: ' + str(start) + '-' + str(stop)
+        tasks.append(_scatter_task(out, data, lead + (slice(start, stop),),
+                                   pos, idx))
+    return tasks
+
+def read_columns(data, region, lead=(), out=None, dtype=float, gap=GAP,
+                 debug=False):
+    """
+    Read data[lead + (..., region)] into a preallocated array.
+
+    Inputs:
+    ------
+      - data = numpy array, memmap or OpenDap proxy
+      - region = indices along the last dimension, list of integers
+
+    Outputs:
+    -------
+      - out = data[lead + (..., region)], numpy array
+
+    Keywords:
+    --------
+      - lead = slices along the leading dimensions, tuple of slices
+      - out = preallocated output, numpy array
+      - dtype = type of the output if out is not provided,
+                None keeps the type of data
+      - gap = see plan_reads
+
+    Notes:
+    -----
+      - in-memory and mmap'd arrays are gathered directly, proxies are
+        read with the few contiguous reads given by plan_reads
+    """
+    region = np.asarray(region, dtype=int)
+    shape = data.shape
+    lead = tuple(lead) + (slice(None),) * (len(shape) - 1 - len(lead))
+    if out is None:
+        size = [len(xrange(*s.indices(n))) for s, n in zip(lead, shape[:-1])]
+        size = tuple(size) + (region.shape[0],)
+        if dtype is None and isinstance(data, np.ndarray):
+            dtype = data.dtype
+        if not dtype is None:
+            out = np.empty(size, dtype=dtype)
+
+    if out is None:
+        #TR: pydap proxies do not carry a dtype, take it from the first read
+        reads = plan_reads(region, gap=gap)
+        start, stop, pos, idx = reads[0]
+        block = np.asarray(data[lead + (slice(start, stop),)])
+        out = np.empty(size, dtype=block.dtype)
+        _scatter(out, block, pos, idx)
+        for start, stop, pos, idx in reads[1:]:
+            _scatter(out, np.asarray(data[lead + (slice(start, stop),)]),
+                     pos, idx)
+    else:
+        run_tasks(_column_tasks(out, data, lead, region, gap=gap,
+                                debug=debug))
+
+    return out
+
+def plan_time_blocks(var, ts, te, region=slice(None), out=None, dtype=float,
+                     gap=GAP, block_bytes=BLOCK_BYTES, debug=False):
+    """
+    Plan the reads of var[ts:te, ..., region] by contiguous blocks of
+    time steps.
+
+    Inputs:
+    ------
+      - var = netcdf or OpenDap variable with time as first dimension and
+              nele or nnode as last dimension
+      - ts = first time index, integer
+      - te = last time index + 1, integer
+
+    Outputs:
+    -------
+      - out = preallocated output, filled once all the tasks have run
+      - tasks = independent reads, list of callables (see run_tasks)
+
+    Keywords:
+    --------
+      - region = indices along the last dimension, slice or list of integers
+      - out = preallocated output, numpy array
+      - dtype = type of the output if out is not provided
+      - gap = see plan_reads
+      - block_bytes = size of the blocks in bytes, integer
+
+    Notes:
+    -----
+      - each block is written straight into out
+    """
+    data = var.data
+    if type(region)==slice:
+        size = len(xrange(*region.indices(data.shape[-1])))
+    else:
+        region = np.asarray(region, dtype=int)
+        size = region.shape[0]
+    if out is None:
+        out = np.empty((te - ts,) + tuple(data.shape[1:-1]) + (size,),
+                       dtype=dtype)
+    lvl = (slice(None),) * (len(data.shape) - 2)
+    step = time_block_size(data, block_bytes=block_bytes)
+    tasks = []
+    for t0 in range(ts, te, step):
+        t1 = min(t0 + step, te)
+        if debug: print 'Time block: ' + str(t0) + '-' + str(t1)
+        lead = (slice(t0, t1),) + lvl
+        if type(region)==slice:
+            tasks.append(_copy_task(out[t0-ts:t1-ts,...], data,
+                                    lead + (region,)))
+        else:
+            tasks.extend(_column_tasks(out[t0-ts:t1-ts,...], data, lead,
+                                       region, gap=gap, debug=debug))
+
+    return out, tasks
+
+def read_time_blocks(var, ts, te, region=slice(None), out=None, dtype=float,
+                     gap=GAP, block_bytes=BLOCK_BYTES, workers=1, debug=False):
+    """
+    Read var[ts:te, ..., region] by contiguous blocks of time steps.
+
+    Inputs:
+    ------
+      - var = netcdf or OpenDap variable with time as first dimension and
+              nele or nnode as last dimension
+      - ts = first time index, integer
+      - te = last time index + 1, integer
+
+    Outputs:
+    -------
+      - out = var[ts:te, ..., region], numpy array
+
+    Keywords:
+    --------
+      - workers = number of blocks read concurrently, integer
+      - see plan_time_blocks for the other keywords
+    """
+    out, tasks = plan_time_blocks(var, ts, te, region=region, out=out,
+                                  dtype=dtype, gap=gap,
+                                  block_bytes=block_bytes, debug=debug)
+    run_tasks(tasks, workers=workers)
+
+    return out
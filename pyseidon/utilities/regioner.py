@@ -1,11 +1,25 @@
 from __future__ import division
+import os
 import numpy as np
-from bisect import bisect_left, bisect_right
 import matplotlib.pyplot as plt
 import matplotlib.tri as Tri
+from matplotlib.path import Path
 #quick fix
 #import netCDF4 as nc
 import scipy.io.netcdf as nc
+from disk_cache import DiskCache, CACHE_ROOT, _digest
+
+#Pre-defined regions, [minlon, maxlon, minlat, maxlat]
+REGIONS = {'GP': [-66.36, -66.31, 44.24, 44.3],
+           'PP': [-66.23, -66.19, 44.37, 44.41],
+           'DG': [-65.84, -65.73, 44.64, 44.72]}
+
+#Regions already extracted, in memory and on disk, see cached_regioner
+MEMO_SIZE = 32
+#Format of the regions kept on disk, to be increased when regioner changes
+FORMAT = 2
+_memo = {}
+_cache = DiskCache(os.path.join(CACHE_ROOT, 'regions'))
 
 def node_region(ax, lon, lat):
 
@@ -18,6 +32,81 @@ def node_region(ax, lon, lat):
 
     return region_n
 
+def _is_number(value):
+    return np.isscalar(value) and not isinstance(value, basestring)
+
+def is_box(ax):
+    """Tells if ax is a bounding box, [minlon, maxlon, minlat, maxlat]"""
+    return isinstance(ax, (list, tuple, np.ndarray)) and len(ax)==4 and \
+           all([_is_number(a) for a in ax])
+
+def is_mask(ax):
+    """Tells if ax is an element mask, boolean array (nele)"""
+    return isinstance(ax, np.ndarray) and ax.dtype==bool
+
+def split_regions(ax):
+    """
+    List the boxes and polygons making a region.
+
+    Inputs:
+    ------
+      - ax = pre-defined region name, bounding box, polygon or list of
+             them, ex: [[-66.35, -66.26, 44.23, 44.33], 'GP',
+                        [(-66.3, 44.2), (-66.2, 44.2), (-66.2, 44.3)]]
+
+    Outputs:
+    -------
+      - regions = list of ('box', [minlon, maxlon, minlat, maxlat]) and
+                  ('polygon', array (nvertex, 2) of lon/lat) tuples
+    """
+    if isinstance(ax, basestring):
+        return [('box', REGIONS[ax])]
+    if is_box(ax):
+        return [('box', list(ax))]
+    if len(ax) >= 3 and all([np.shape(a)==(2,) and _is_number(a[0])
+                             for a in ax]):
+        return [('polygon', np.asarray(ax, dtype=float))]
+    regions = []
+    for a in ax:
+        regions.extend(split_regions(a))
+    return regions
+
+def element_region(ax, lon, lat, lonc, latc, nv):
+    """
+    Indices of the elements within a region.
+
+    Inputs:
+    ------
+      - ax = region, see split_regions, or element mask, boolean array
+             (nele)
+      - lon, lat = node coordinates, 1D arrays (nnode)
+      - lonc, latc = element coordinates, 1D arrays (nele)
+      - nv = node indices of the elements, 2D array (nele, 3), from 0
+
+    Outputs:
+    -------
+      - element_index = sorted element indices, 1D array
+
+    Notes:
+    -----
+      - an element is within a box if one of its nodes is
+      - an element is within a polygon if one of its nodes or its
+        center is, so that narrow polygons still catch elements
+    """
+    if is_mask(ax):
+        return np.where(ax)[0]
+    inside = np.zeros(nv.shape[0], bool)
+    for kind, shape in split_regions(ax):
+        if kind=='box':
+            nodes = np.zeros(lon.shape[0], bool)
+            nodes[node_region(shape, lon, lat)] = True
+            inside |= nodes[nv].any(axis=1)
+        else:
+            path = Path(shape)
+            nodes = path.contains_points(np.column_stack((lon, lat)))
+            inside |= nodes[nv].any(axis=1)
+            inside |= path.contains_points(np.column_stack((lonc, latc)))
+    return np.where(inside)[0]
 
 def regioner(gridVar, ax, debug=False):
     """
@@ -64,67 +153,25 @@ on. Default is 2D.
     lonc = gridVar.lonc[:]
     latc = gridVar.latc[:]
 
-    l = nv.shape[0]
-
-    idx = node_region(ax, lon, lat)
-
-    #first, reindex elements in the region
-    element_index_tmp = np.zeros(l, int)
-    nv_rs = nv.reshape(l*3, order='F')
-    #find indices that sort nv_rs
-    nv_sortedind = nv_rs.argsort()
-    #sort the array
-    nv_sortd = nv_rs[nv_sortedind]
-    #pick out the values in the region
+    #first, pick out the elements in the region
     if debug:
         print 'Extracting values from box...'
-    #TR comment: very slow...gonna need optimisation down the line
-    for i in xrange(len(idx)):
-        i1 = bisect_left(nv_sortd, idx[i])
-        i2 = bisect_right(nv_sortd, idx[i])
-        inds = nv_sortedind[i1:i2]
-        element_index_tmp[inds % l] = 1
-        element_index = np.where(element_index_tmp == 1)[0]
-        node_index = np.unique(nv[element_index,:])
-        #create new linkage arrays
-        nv_tmp = nv[element_index,:]
-        L = len(nv_tmp[:,0])
-        #nv_tmp2 = np.empty((1, L*3.0))
-        nv_tmp2 = np.empty((1, L*3))
-
-    #make a new array of the node labellings for the tri's in the region
+    element_index = element_region(ax, lon, lat, lonc, latc, nv)
+    nv_tmp = nv[element_index,:]
+    node_index = np.unique(nv_tmp)
+
+    #make a new array of the node labellings for the tri's in the region,
+    #i.e. position in node_index, through a lookup table
     if debug:
         print 'Re-labelling elements and nodes...'
-    nv2 = nv_tmp.reshape(L * 3, order='F')
-    nv2_sortedind = nv2.argsort()
-    nv2_sortd = nv2[nv2_sortedind]
-
-    for i in xrange(len(node_index)):
-        i1 = bisect_left(nv2_sortd, node_index[i])
-        i2 = bisect_right(nv2_sortd, node_index[i])
-        inds = nv2_sortedind[i1:i2]
-        nv_tmp2[0, inds] = i
-
-    nv_new = np.reshape(nv_tmp2, (L, 3), 'F')
-    #now do the same for nbe
-    nbe_index = np.unique(nbe[element_index, :])
-    nbe_tmp = nbe[element_index,:]
-    lnbe = len(nbe_tmp[:,0])
-    nbe_tmp2 = np.empty((1, lnbe*3))
-
-    nbe2 = nbe_tmp.reshape(lnbe*3, order='F')
-    nbe_sortedind = nbe2.argsort()
-    nbe_sortd = nbe2[nbe_sortedind]
-
-    for i in xrange(len(nbe_index)):
-        i1 = bisect_left(nbe_sortd, nbe_index[i])
-        i2 = bisect_right(nbe_sortd, nbe_index[i])
-        inds = nbe_sortedind[i1:i2]
-        nbe_tmp2[0, inds] = i
-
-    nbe_new = np.reshape(nbe_tmp2, (lnbe,3), 'F')
-    #nbe_new[nbe_new > len(nv_new[:,0]), :] = 0
-    nbe_new[nbe_new > len(nv_new[:,0])] = 0
+    lut = np.zeros(lon.shape[0], int)
+    lut[node_index] = np.arange(node_index.shape[0])
+    nv_new = lut[nv_tmp]
+    #now do the same for nbe, which counts from 1 with 0 for no neighbour.
+    #Neighbours outside the region become 0
+    lut = np.zeros(max(lonc.shape[0], nbe.max()) + 1, int)
+    lut[element_index + 1] = np.arange(1, element_index.shape[0] + 1)
+    nbe_new = lut[nbe[element_index,:]]
 
     #create new variables for the region
 
@@ -155,3 +202,68 @@ on. Default is 2D.
 
     return data
 
+
+def grid_fingerprint(gridVar):
+    """sha1 digest of the connectivity and node coordinates of a grid"""
+    text = ''
+    for value in [gridVar.trinodes, gridVar.lon, gridVar.lat]:
+        text += np.ascontiguousarray(value[:]).tostring()
+    return _digest(text)
+
+def _region_key(ax):
+    """Exact text representation of a region"""
+    if is_mask(ax):
+        return 'mask ' + _digest(np.packbits(ax).tostring()) + \
+               ' ' + str(ax.shape[0])
+    if hasattr(ax, 'tolist'):
+        ax = ax.tolist()
+    if isinstance(ax, (list, tuple)):
+        return '[' + ', '.join([_region_key(a) for a in ax]) + ']'
+    return repr(ax)
+
+def cached_regioner(gridVar, ax, debug=False):
+    """
+    Same as regioner, with its results kept in memory and on disk.
+
+    Inputs:
+    ------
+      - gridVar = grid, see regioner
+      - ax = region, see regioner
+
+    Outputs:
+    -------
+      - data = see regioner
+
+    Notes:
+    -----
+      - results are keyed by the grid fingerprint and the region, so
+        that they are shared by the files of a run and across sessions
+      - the arrays are copies, the triangulation is shared
+    """
+    key = str(FORMAT) + ' ' + grid_fingerprint(gridVar) + ' ' + \
+          _region_key(ax)
+    data = _memo.get(key)
+    if data is None:
+        try:
+            data = _cache.get(key, namespace='regions')
+            if debug: print 'Region found in cache...'
+            data['triangle'] = Tri.Triangulation(data['lon'], data['lat'],
+                                                 data['nv'])
+        except KeyError:
+            data = regioner(gridVar, ax, debug=debug)
+            stored = dict(data)
+            del stored['triangle']
+            _cache.put(key, stored, namespace='regions')
+        if len(_memo) >= MEMO_SIZE:
+            _memo.clear()
+        _memo[key] = data
+    elif debug:
+        print 'Region found in memory...'
+
+    return dict([(k, v if k=='triangle' else v.copy())
+                 for k, v in data.items()])
+
+def invalidate_regions():
+    """Forget the regions kept in memory and on disk"""
+    _memo.clear()
+    _cache.invalidate()
@@ -0,0 +1,197 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import numpy as np
+import matplotlib.tri as Tri
+from scipy.spatial import cKDTree
+from interpolation_utils import barycentric, TOLERANCE
+
+#Nearest centres searched for the containing element without trifinder
+CANDIDATES = 16
+
+class SpatialIndex(object):
+    """
+    Description:
+    -----------
+    KD-tree of grid coordinates answering nearest-k and radius queries
+    for many points at once, i.e. O(log n) per point.
+
+    Inputs:
+    ------
+      - lon = longitudes in degrees, 1D array
+      - lat = latitudes in degrees, 1D array
+
+    Notes:
+    -----
+      - distances are in degrees, as for interpolation_utils.closest_point
+      - the index can be pickled, i.e. it survives Save_as
+    """
+    def __init__(self, lon, lat):
+        points = np.column_stack((np.asarray(lon[:], dtype=np.float64),
+                                  np.asarray(lat[:], dtype=np.float64)))
+        self.size = points.shape[0]
+        self._tree = cKDTree(points)
+
+    def nearest(self, pt_lon, pt_lat, k=1):
+        """
+        Indices of the k nearest grid points.
+
+        Inputs:
+        ------
+          - pt_lon = longitudes in degrees, float or list of floats
+          - pt_lat = latitudes in degrees, float or list of floats
+
+        Outputs:
+        -------
+          - index = grid indices, 1D array (npoint), or 2D array
+                    (npoint, k) if k > 1
+
+        Keywords:
+        --------
+          - k = number of neighbours, integer
+        """
+        points = np.column_stack((np.atleast_1d(pt_lon),
+                                  np.atleast_1d(pt_lat)))
+        dist, index = self._tree.query(points, k=k)
+        return index
+
+    def within(self, pt_lon, pt_lat, radius):
+        """
+        Indices of the grid points within a radius.
+
+        Inputs:
+        ------
+          - pt_lon = longitudes in degrees, float or list of floats
+          - pt_lat = latitudes in degrees, float or list of floats
+          - radius = radius in degrees, float
+
+        Outputs:
+        -------
+          - index = grid indices, list (npoint) of sorted 1D arrays
+        """
+        points = np.column_stack((np.atleast_1d(pt_lon),
+                                  np.atleast_1d(pt_lat)))
+        return [np.array(sorted(i), dtype=int)
+                for i in self._tree.query_ball_point(points, radius)]
+
+def spatial_index(grid, kind='element'):
+    """
+    Spatial index of a Grid, built on first call.
+
+    Inputs:
+    ------
+      - grid = FVCOM or Station Grid
+
+    Outputs:
+    -------
+      - index = SpatialIndex of lonc/latc, or of lon/lat
+
+    Keywords:
+    --------
+      - kind = 'element' for lonc/latc, 'node' for lon/lat
+
+    Notes:
+    -----
+      - the index is stored in the grid, as _element_tree or _node_tree,
+        and rebuilt if the grid size changed
+      - ex: index = spatial_index(fvcom.Grid).nearest(lons, lats)
+    """
+    if kind=='element':
+        name, lon, lat = '_element_tree', 'lonc', 'latc'
+    else:
+        name, lon, lat = '_node_tree', 'lon', 'lat'
+    index = getattr(grid, name, None)
+    size = np.shape(getattr(grid, lon))[0]
+    if index is None or not getattr(index, 'size', None)==size:
+        index = SpatialIndex(getattr(grid, lon), getattr(grid, lat))
+        setattr(grid, name, index)
+    return index
+
+def triangulation(grid):
+    """
+    Triangulation of the whole Grid, built on first call.
+
+    Inputs:
+    ------
+      - grid = FVCOM Grid
+
+    Outputs:
+    -------
+      - tri = matplotlib Triangulation of lon/lat and trinodes
+
+    Notes:
+    -----
+      - the triangulation is stored as grid.triangle. It is not pickled by
+        Save_as and is therefore rebuilt on first use after reload
+    """
+    tri = getattr(grid, 'triangle', None)
+    if tri is None or not tri.triangles.shape[0]==grid.trinodes.shape[0]:
+        tri = Tri.Triangulation(grid.lon[:], grid.lat[:],
+                                triangles=grid.trinodes[:])
+        grid.triangle = tri
+    return tri
+
+def locate(grid, pt_lon, pt_lat, snap=True):
+    """
+    Indices of the elements containing given points.
+
+    Inputs:
+    ------
+      - grid = FVCOM Grid
+      - pt_lon = longitudes in degrees, float or list of floats
+      - pt_lat = latitudes in degrees, float or list of floats
+
+    Outputs:
+    -------
+      - index = element indices, 1D array (npoint)
+
+    Keywords:
+    --------
+      - snap = True to give points outside the mesh the element with the
+               nearest centre, False to give them -1
+
+    Notes:
+    -----
+      - snapped points are listed in a warning. Interpolating there gives
+        masked or nan values, see interp_at_point and Probe
+      - the trifinder is built once per triangulation, see triangulation.
+        If the mesh can't be triangulated by matplotlib, the elements are
+        searched among the CANDIDATES nearest centres instead
+    """
+    pt_lon = np.atleast_1d(np.asarray(pt_lon, dtype=np.float64))
+    pt_lat = np.atleast_1d(np.asarray(pt_lat, dtype=np.float64))
+    tri = triangulation(grid)
+    index = -np.ones(pt_lon.shape, dtype=np.int64)
+    if not getattr(tri, '_invalid', False):
+        try:
+            index[:] = tri.get_trifinder()(pt_lon, pt_lat)
+        except RuntimeError:
+            #TR: overlapping or degenerated triangles, matplotlib can't cope
+            print "---Invalid triangulation, nearest elements searched instead---"
+            tri._invalid = True
+    if getattr(tri, '_invalid', False):
+        index[:] = _search(grid, pt_lon, pt_lat)
+    outside = np.where(index < 0)[0]
+    if snap and outside.shape[0] > 0:
+        print "---Points outside the mesh, nearest elements used: " + \
+              str(list(outside)) + "---"
+        index[outside] = spatial_index(grid).nearest(pt_lon[outside],
+                                                     pt_lat[outside])
+    return index
+
+def _search(grid, pt_lon, pt_lat):
+    """Elements containing points among the nearest centres, -1 if none"""
+    k = min(CANDIDATES, grid.nele)
+    candidates = spatial_index(grid).nearest(pt_lon, pt_lat, k=k)
+    candidates = np.asarray(candidates).reshape(pt_lon.shape[0], k)
+    weights = barycentric(np.repeat(pt_lon, k), np.repeat(pt_lat, k),
+                          grid.lon[:], grid.lat[:], grid.trinodes[:],
+                          candidates.ravel())
+    with np.errstate(invalid='ignore'):
+        inside = weights.min(axis=1) >= -TOLERANCE
+    inside = inside.reshape(candidates.shape)
+    first = np.argmax(inside, axis=1)
+    index = candidates[np.arange(pt_lon.shape[0]), first]
+    index[~inside.any(axis=1)] = -1
+    return index
@@ -0,0 +1,208 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import os
+import sys
+import shutil
+import socket
+import httplib
+import tempfile
+import threading
+import unittest
+import numpy as np
+from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler
+from SocketServer import ThreadingMixIn
+from pydap.model import DatasetType, BaseType
+from pydap.handlers.lib import SimpleHandler
+from pydap.exceptions import ServerError
+
+#Add local path to utilities
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import opendap_utils
+
+#Cache at import, before the tests turn it on or off
+_default_cache = opendap_utils._cache
+
+#Answer of the server to a dropped connection, nothing. httplib2 reconnects
+#once by itself on an empty answer, so a connection error reaches request
+#after two drops
+DROP = ['drop', 'drop']
+
+def _dataset():
+    """Small FVCOM like dataset, time and el, dim=(time, node)"""
+    dataset = DatasetType('test')
+    time = np.arange(10, dtype=np.float64)
+    el = np.arange(60, dtype=np.float32).reshape(10, 6) / 10.0
+    dataset['time'] = BaseType('time', time, shape=time.shape, type='d',
+                               dimensions=('time',))
+    dataset['el'] = BaseType('el', el, shape=el.shape, type='f',
+                             dimensions=('time', 'node'))
+    return dataset
+
+class _Server(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+class _Handler(WSGIRequestHandler):
+    """Request handler dropping the connection when asked by the faults"""
+    def handle(self):
+        if self.server.next_fault('drop'):
+            #Read the request and close without answering
+            self.raw_requestline = self.rfile.readline()
+            self.parse_request()
+            return
+        WSGIRequestHandler.handle(self)
+
+    def log_message(self, *args):
+        pass
+
+class DapServer(object):
+    """
+    Local OpenDap server of _dataset, through the pydap handler.
+
+    The faults list is consumed one item per connection: 'drop' closes the
+    connection without answering, an integer is answered as an http status,
+    ex: server.faults = [503] + DROP.
+    sizes holds the body lengths of the 200 answers.
+    """
+    def __init__(self):
+        self.faults = []
+        self.sizes = []
+        self._lock = threading.Lock()
+        self._app = SimpleHandler(_dataset())
+        self._server = make_server('127.0.0.1', 0, self._wsgi,
+                                   server_class=_Server,
+                                   handler_class=_Handler)
+        self._server.next_fault = self.next_fault
+        self.url = 'http://127.0.0.1:' + str(self._server.server_port) + \
+                   '/test.nc'
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def next_fault(self, kind):
+        """Pop the next fault if of the given kind, 'drop' or 'status'"""
+        with self._lock:
+            if self.faults==[]:
+                return None
+            fault = self.faults[0]
+            if (kind=='drop')==(fault=='drop'):
+                return self.faults.pop(0)
+            return None
+
+    def _wsgi(self, environ, start_response):
+        status = self.next_fault('status')
+        if not status is None:
+            start_response(str(status) + ' Injected',
+                           [('Content-Type', 'text/plain')])
+            return ['injected']
+        answer = {}
+        def start(status, headers, exc_info=None):
+            answer['status'] = status
+            answer['headers'] = headers
+        body = ''.join(self._app(environ, start))
+        start_response(answer['status'], answer['headers'])
+        if answer['status'].startswith('200'):
+            with self._lock:
+                self.sizes.append(len(body))
+        return [body]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class RequestTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = DapServer()
+        cls.dataset = _dataset()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def setUp(self):
+        self.backoff = opendap_utils.BACKOFF
+        opendap_utils.BACKOFF = 0.0
+        opendap_utils.cache_off()
+        opendap_utils.reset_stats()
+        self.server.faults = []
+        self.server.sizes = []
+
+    def tearDown(self):
+        opendap_utils.BACKOFF = self.backoff
+
+    def test_no_fault(self):
+        data = opendap_utils.open_url(self.server.url)
+        el = data['el'][2:5, 1:4]
+        np.testing.assert_array_equal(np.asarray(el),
+                                      self.dataset['el'].data[2:5, 1:4])
+        s = opendap_utils.stats()
+        self.assertEqual(s['retries'], 0)
+        self.assertEqual(s['requests'], len(self.server.sizes))
+        self.assertEqual(s['bytes'], sum(self.server.sizes))
+
+    def test_retry_status(self):
+        data = opendap_utils.open_url(self.server.url)
+        opendap_utils.reset_stats()
+        self.server.sizes = []
+        self.server.faults = opendap_utils.RETRY_STATUS[:3]
+        el = data['el'][:, 2]
+        np.testing.assert_array_equal(np.asarray(el).ravel(),
+                                      self.dataset['el'].data[:, 2])
+        s = opendap_utils.stats()
+        self.assertEqual(s['retries'], 3)
+        self.assertEqual(s['requests'], 1)
+        self.assertEqual(s['bytes'], sum(self.server.sizes))
+        self.assertEqual(self.server.faults, [])
+
+    def test_dropped_connection(self):
+        self.server.faults = DROP + [503] + DROP
+        data = opendap_utils.open_url(self.server.url)
+        time = data['time'][:]
+        np.testing.assert_array_equal(np.asarray(time),
+                                      self.dataset['time'].data)
+        s = opendap_utils.stats()
+        self.assertEqual(s['retries'], 3)
+        self.assertEqual(s['requests'], len(self.server.sizes))
+        self.assertEqual(s['bytes'], sum(self.server.sizes))
+        self.assertEqual(self.server.faults, [])
+
+    def test_give_up(self):
+        url = self.server.url + '.dds'
+        self.server.faults = [503] * opendap_utils.RETRIES
+        self.assertRaises(ServerError, opendap_utils.request, url)
+        self.server.faults = DROP * opendap_utils.RETRIES
+        self.assertRaises((socket.error, httplib.HTTPException),
+                          opendap_utils.request, url)
+        s = opendap_utils.stats()
+        self.assertEqual(s['retries'], 2 * (opendap_utils.RETRIES - 1))
+        self.assertEqual(s['requests'], 0)
+        self.assertEqual(s['bytes'], 0)
+        self.assertEqual(self.server.faults, [])
+
+    def test_cache(self):
+        self.assertTrue(_default_cache is None)
+        directory = tempfile.mkdtemp()
+        try:
+            opendap_utils.cache_on(directory)
+            for attempt in range(2):
+                data = opendap_utils.open_url(self.server.url)
+                el = data['el'][4:6, :]
+                np.testing.assert_array_equal(np.asarray(el),
+                                              self.dataset['el'].data[4:6])
+            s = opendap_utils.stats()
+            self.assertEqual(s['requests'], len(self.server.sizes))
+            self.assertEqual(s['hits'], s['requests'])
+            self.assertEqual(s['bytes'], sum(self.server.sizes))
+            since = dict([(key, 0) for key in s])
+            self.assertTrue(opendap_utils.transfer_summary(since).endswith(
+                            str(s['hits']) + ' cache hits'))
+        finally:
+            opendap_utils.cache_off()
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
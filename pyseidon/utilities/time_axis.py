@@ -0,0 +1,225 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import numpy as np
+
+#Matlab datenum of 1970-01-01, i.e. datetime64 epoch
+EPOCH = 719529
+#Microseconds per day
+DAY = 86400000000
+
+def datenum_to_datetime64(datenum):
+    """
+    Convert matlab datenums to datetime64[us], vectorised.
+
+    Inputs:
+    ------
+      - datenum = matlab time, float or array of floats
+
+    Outputs:
+    -------
+      - time = datetime64[us] array of the same shape
+
+    Notes:
+    -----
+      - days and fraction of day are converted separately, as
+        datetime.fromordinal plus timedelta would do
+    """
+    datenum = np.asarray(datenum, dtype=np.float64)
+    days = np.floor(datenum)
+    us = (days.astype(np.int64) - EPOCH) * DAY + \
+         np.round((datenum - days) * DAY).astype(np.int64)
+    return us.astype('datetime64[us]')
+
+def datetime64_to_datenum(time):
+    """
+    Convert dates to matlab datenums, vectorised.
+
+    Inputs:
+    ------
+      - time = date string 'yyyy-mm-ddThh:mm:ss', datetime or datetime64,
+               or list/array of them
+
+    Outputs:
+    -------
+      - datenum = matlab time, float or array of floats
+    """
+    us = np.asarray(time, dtype='datetime64[us]').astype(np.int64)
+    return us / DAY + EPOCH
+
+class TimeAxis(object):
+    """
+    Description:
+    -----------
+    Index of a time series, built once per Variables object.
+
+    Time is held as a sorted array of matlab datenums, together with its
+    datetime64[us] conversion, so that range and nearest-time queries are
+    binary searches, i.e. O(log ntime).
+
+    Inputs:
+    ------
+      - datenum = matlab time, 1D array (ntime)
+
+    Notes:
+    -----
+      - indices refer to the original order of datenum, even if it is not
+        sorted
+    """
+    def __init__(self, datenum):
+        datenum = np.asarray(datenum[:], dtype=np.float64).ravel()
+        self.ntime = datenum.shape[0]
+        #Permutation to the original order, None if already sorted
+        self._order = None
+        if self.ntime > 1 and np.any(np.diff(datenum) < 0.0):
+            self._order = np.argsort(datenum, kind='mergesort')
+            datenum = datenum[self._order]
+        self.datenum = datenum
+        self._us = datenum_to_datetime64(datenum).astype(np.int64)
+
+    def __len__(self):
+        return self.ntime
+
+    def _original(self, index):
+        """Sorted indices to original indices"""
+        if self._order is None:
+            return index
+        return self._order[index]
+
+    def datetime64(self):
+        """Time as datetime64[us], 1D array (ntime), original order"""
+        time = self._us.astype('datetime64[us]')
+        if self._order is None:
+            return time
+        out = np.empty_like(time)
+        out[self._order] = time
+        return out
+
+    def bounds(self, t_start, t_end):
+        """
+        Positions, in sorted time, of the period [t_start, t_end].
+
+        Inputs:
+        ------
+          - t_start = start time, string 'yyyy-mm-ddThh:mm:ss'
+          - t_end = end time, string 'yyyy-mm-ddThh:mm:ss'
+
+        Outputs:
+        -------
+          - start, end = integers, such as sorted time[start:end] lies
+                         within [t_start, t_end]
+
+        Notes:
+        -----
+          - raises ValueError if no time step lies within [t_start, t_end]
+        """
+        t = np.array([t_start, t_end], dtype='datetime64[us]')
+        t = t.astype(np.int64)
+        start = np.searchsorted(self._us, t[0], side='left')
+        end = np.searchsorted(self._us, t[1], side='right')
+        if not end > start:
+            available = 'no time step'
+            if self.ntime > 0:
+                first, last = self._us[[0, -1]].astype('datetime64[us]')
+                available = str(first.astype('datetime64[s]')) + ' to ' + \
+                            str(last.astype('datetime64[s]'))
+            raise ValueError('Wrong time input: no time step within ' +
+                             str(t_start) + ' to ' + str(t_end) +
+                             ', available: ' + available)
+        return int(start), int(end)
+
+    def index(self, t_start, t_end, debug=False):
+        """
+        Indices of the time steps within [t_start, t_end].
+
+        Inputs:
+        ------
+          - t_start = start time, string 'yyyy-mm-ddThh:mm:ss'
+          - t_end = end time, string 'yyyy-mm-ddThh:mm:ss'
+
+        Outputs:
+        -------
+          - argtime = time indices, 1D array of integers
+
+        Notes:
+        -----
+          - raises ValueError if no time step lies within [t_start, t_end]
+        """
+        start, end = self.bounds(t_start, t_end)
+        argtime = self._original(np.arange(start, end))
+        if self._order is not None:
+            argtime = np.sort(argtime)
+        if debug:
+            print 'Argtime: ', argtime
+        return argtime
+
+    def slice(self, t_start, t_end):
+        """
+        Same as index as a slice, for sorted time only.
+
+        Inputs:
+        ------
+          - t_start = start time, string 'yyyy-mm-ddThh:mm:ss'
+          - t_end = end time, string 'yyyy-mm-ddThh:mm:ss'
+
+        Outputs:
+        -------
+          - region = slice of the time steps
+        """
+        if self._order is not None:
+            raise ValueError('time is not sorted')
+        start, end = self.bounds(t_start, t_end)
+        return slice(start, end)
+
+    def nearest(self, time):
+        """
+        Index of the time step nearest to a given time.
+
+        Inputs:
+        ------
+          - time = string 'yyyy-mm-ddThh:mm:ss', datetime64, or matlab
+                   datenum (float), or list/array of them
+
+        Outputs:
+        -------
+          - index = integer, or array of integers
+        """
+        time = np.asarray(time)
+        if time.dtype.kind in 'fiu':
+            us = datenum_to_datetime64(time).astype(np.int64)
+        else:
+            us = time.astype('datetime64[us]').astype(np.int64)
+        pos = np.clip(np.searchsorted(self._us, us), 1, max(self.ntime - 1, 1))
+        before = self._us[pos - 1]
+        after = self._us[np.minimum(pos, self.ntime - 1)]
+        pos = np.where(np.abs(us - before) <= np.abs(after - us), pos - 1, pos)
+        index = self._original(np.minimum(pos, self.ntime - 1))
+        if np.ndim(index)==0:
+            return int(index)
+        return index
+
+def time_axis(variables):
+    """
+    TimeAxis of a Variables object, built on first call.
+
+    Inputs:
+    ------
+      - variables = FVCOM, Station, ADCP or TideGauge Variables, with
+                    matlabTime
+
+    Outputs:
+    -------
+      - axis = TimeAxis
+
+    Notes:
+    -----
+      - the axis is stored as variables._time and rebuilt if matlabTime
+        changed length, ex: after stacking two objects
+    """
+    axis = getattr(variables, '_time', None)
+    ntime = np.shape(variables.matlabTime)[0]
+    if axis is None or not getattr(axis, 'ntime', None)==ntime:
+        axis = TimeAxis(variables.matlabTime)
+        variables._time = axis
+    return axis
@@ -0,0 +1,180 @@
+#!/usr/bin/python2.7
+# encoding: utf-8
+
+from __future__ import division
+import numpy as np
+import numexpr as ne
+from memory_utils import allocate, time_chunks
+from read_utils import BLOCK_BYTES
+
+#Default turbine parameters, see FVCOM power assessment methods
+TURBINE = {'cut_in': 1.0, 'cut_out': 4.5, 'tsr': 4.3,
+           'a4': 0.002, 'a3': -0.03, 'a2': 0.1, 'a1': -0.1, 'a0': 0.8,
+           'b2': -0.02, 'b1': 0.2, 'b0': -0.005}
+#Power curve times device controlled power coefficient times power density
+POWER = '(a4*(u**4) + a3*(u**3) + a2*(u**2) + a1*u + a0)' + \
+        '*(b2*(tsr**2) + b1*tsr + b0)*0.5*1025.0*(u**3)'
+
+def turbine(parameters={}):
+    """
+    Complete turbine parameters with the defaults.
+
+    Inputs:
+    ------
+      - parameters = turbine parameters, dictionary,
+                     ex: {'cut_in': 0.8, 'tsr': 4.0}
+
+    Outputs:
+    -------
+      - turbine = all the parameters, dictionary, see TURBINE
+    """
+    unknown = [key for key in parameters if not key in TURBINE]
+    if not unknown==[]:
+        raise ValueError('unknown turbine parameters: ' + ', '.join(unknown))
+    out = dict(TURBINE)
+    out.update(parameters)
+    return out
+
+def power_limits(parameters):
+    """
+    Power at cut-in and cut-out speeds.
+
+    Inputs:
+    ------
+      - parameters = turbine parameters, dictionary, see turbine
+
+    Outputs:
+    -------
+      - pdin, pdout = powers in W/m2, floats
+    """
+    par = turbine(parameters)
+    limits = []
+    for speed in [par['cut_in'], par['cut_out']]:
+        scalars = dict(par)
+        scalars['u'] = speed
+        limits.append(float(ne.evaluate(POWER, local_dict=scalars)))
+    return limits[0], limits[1]
+
+def clipped_power(speed, parameters, out=None):
+    """
+    Turbine power for a block of speeds.
+
+    Inputs:
+    ------
+      - speed = flow speed in m/s, numpy array
+      - parameters = turbine parameters, dictionary, see turbine
+
+    Outputs:
+    -------
+      - pd = power in W/m2, numpy array of the shape of speed
+
+    Keywords:
+    --------
+      - out = array to write pd into, float64 array of the shape of speed
+
+    Notes:
+    -----
+      - pd is set to 0 below the cut-in power and to the cut-out power above
+    """
+    par = turbine(parameters)
+    pdin, pdout = power_limits(par)
+    par['u'] = speed
+    pd = ne.evaluate(POWER, local_dict=par, out=out)
+    pd[pd < pdin] = 0.0
+    np.minimum(pd, pdout, out=pd)
+    return pd
+
+def _speed(components, t):
+    """Flow speed of the velocity components over the time steps t"""
+    if len(components)==1:
+        return np.abs(np.asarray(components[0][t], dtype=np.float64))
+    ex = 'sqrt(' + ' + '.join(['c' + str(i) + '**2'
+                               for i in range(len(components))]) + ')'
+    return ne.evaluate(ex, local_dict=dict(
+           [('c' + str(i), np.asarray(c[t], dtype=np.float64))
+            for i, c in enumerate(components)]))
+
+def power_series(components, parameters={}, dtype=float,
+                 max_memory=None):
+    """
+    Turbine power time series, by chunks of time steps.
+
+    Inputs:
+    ------
+      - components = velocity components, list of arrays of same shape,
+                     ex: [ua, va], [u, v, w] or [velo_norm]
+
+    Outputs:
+    -------
+      - pd = power in W/m2, numpy array or memmap of the shape of the
+             components
+
+    Keywords:
+    --------
+      - parameters = turbine parameters, dictionary, see turbine
+      - dtype = type of the output
+      - max_memory = memory budget in bytes, integer. Chunks are limited
+                     to read_utils.BLOCK_BYTES if None
+    """
+    shape = tuple(components[0].shape)
+    out = allocate(shape, dtype=dtype, max_memory=max_memory)
+    budget = max_memory
+    if budget is None:
+        budget = BLOCK_BYTES
+    #TR: counted as float64, components, speed and power
+    step = 8 * int(np.prod(shape[1:])) * (len(components) + 2)
+    for t in time_chunks(shape[0], step, budget):
+        out[t] = clipped_power(_speed(components, t), parameters)
+
+    return out
+
+def power_sweep(components, parameters, max_memory=None):
+    """
+    Mean power and capacity factor of several turbines, in one pass over
+    the velocity data.
+
+    Inputs:
+    ------
+      - components = velocity components, list of arrays of same shape,
+                     ex: [ua, va], [u, v, w] or [velo_norm]
+      - parameters = turbine parameters, list of dictionaries,
+                     ex: [{'cut_in': 0.8}, {'cut_in': 1.2, 'tsr': 4.0}]
+
+    Outputs:
+    -------
+      - mean = mean power in W/m2, numpy array, dim=(turbine,)+space
+      - factor = capacity factor, numpy array, dim=(turbine,)+space
+
+    Keywords:
+    --------
+      - max_memory = memory budget in bytes, integer. Chunks are limited
+                     to read_utils.BLOCK_BYTES if None
+
+    Notes:
+    -----
+      - space is the shape of the components without time, ex: (nele)
+        or (level, nele)
+      - the capacity factor is the mean power over the rated power,
+        i.e. the cut-out power
+    """
+    sets = [turbine(par) for par in parameters]
+    shape = tuple(components[0].shape)
+    ntime = shape[0]
+    total = np.zeros((len(sets),) + shape[1:])
+    budget = max_memory
+    if budget is None:
+        budget = BLOCK_BYTES
+    #TR: counted as float64, components, speed and power
+    step = 8 * int(np.prod(shape[1:])) * (len(components) + 2)
+    for t in time_chunks(ntime, step, budget):
+        speed = _speed(components, t)
+        pd = np.empty(speed.shape)
+        for i, par in enumerate(sets):
+            total[i] += clipped_power(speed, par, out=pd).sum(axis=0)
+
+    mean = total / ntime
+    rated = np.array([power_limits(par)[1] for par in sets])
+    rated = rated.reshape((-1,) + (1,) * (len(shape) - 1))
+    factor = mean / rated
+
+    return mean, factor
@@ -15,6 +15,7 @@ import scipy.io as sio
 
 #Local import
 from interpolation_utils import *
+from spatial_index import spatial_index
 from stationClass import Station
 from adcpClass import ADCP
 from fvcomClass import FVCOM
@@ -58,9 +59,8 @@ class _load_validation:
         #Check what kind of simulated data it is
         if simulated.__module__=='pyseidon.stationClass.stationClass':
             #Find closest point to ADCP
-            ind = closest_point([self.obs.lon], [self.obs.lat],
-                                simulated.Grid.lon[:],
-                                simulated.Grid.lat[:])
+            ind = spatial_index(simulated.Grid, 'node').nearest(self.obs.lon,
+                                                                self.obs.lat)
             nameSite = ''.join(simulated.Grid.name[ind,:][0,:])
             print "Station site: " + nameSite
             el = self.sim.el[:, ind].flatten()